@@ -0,0 +1,313 @@
+"""
+Batch Module
+
+Headless entry point that generates assessment reports for a whole cohort.
+Candidates are read from a manifest (CSV or JSON) and processed in parallel,
+each in its own workspace (see workspace.py).
+
+Usage:
+    python batch.py cohort.csv --workers 4 [--key GEMINI_KEY] [--thinking]
+    python batch.py render RESULTS.json|DIRECTORY ... [--workers 4]
+    python batch.py cohort.csv --fake-model [--fake-latency 0.2 1.0] [--fake-error-rate 0.1]
+
+The render command regenerates reports from saved results files (e.g. after a
+template change) without calling Gemini; directories are searched for *.json.
+
+Manifest columns / keys (paths are relative to the manifest's folder):
+    name, assessor, gender (M/F), program (MCP/DATA/ICP), papi, cog_test, notes,
+    and for ICP: icp_description, icp_info_prompt3, icp_info_prompt6a, icp_info_prompt6b.
+    An optional enable_thinking column (yes/true/1) overrides --thinking per candidate.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pdf_text
+import model_client
+import prompting
+import retry_policy
+from pipeline import generate_report, render_from_results
+from workspace import Workspace
+
+# Same file the GUI saves the Gemini key to
+KEY_FILE = os.path.expanduser("~/.ormit_gemini_key")
+
+# Manifest column -> key in GUI_data["Files"]
+FILE_COLUMNS = {
+    "papi": "PAPI Gebruikersrapport",
+    "cog_test": "Cog. Test",
+    "notes": "Assessment Notes",
+    "icp_description": "ICP Description",
+}
+
+REQUIRED_COLUMNS = ["name", "assessor", "gender", "program", "papi", "cog_test", "notes"]
+
+def load_manifest(manifest_path):
+    """
+    Reads the cohort manifest.
+
+    Args:
+        manifest_path: Path to a .csv or .json manifest
+
+    Returns:
+        List of row dictionaries
+
+    Raises:
+        ValueError: If the manifest format is unsupported or a required column is missing
+    """
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get("candidates", [])
+    elif manifest_path.lower().endswith('.csv'):
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"Unsupported manifest format: {manifest_path} (use .csv or .json)")
+
+    rows = [{str(k).strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+            for row in rows]
+    for row_no, row in enumerate(rows, start=1):
+        missing = [col for col in REQUIRED_COLUMNS if not row.get(col)]
+        if missing:
+            raise ValueError(f"Manifest row {row_no} is missing: {', '.join(missing)}")
+    return rows
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def build_gui_data(row, api_key, base_dir, enable_thinking=False):
+    """
+    Converts a manifest row into the GUI_data dictionary used by the pipeline.
+
+    Args:
+        row: Manifest row dictionary
+        api_key: Gemini API key
+        base_dir: Folder relative file paths are resolved against
+        enable_thinking: Default for the thinking setting
+
+    Returns:
+        GUI_data dictionary
+    """
+    files = {}
+    for column, file_key in FILE_COLUMNS.items():
+        path = row.get(column)
+        if path:
+            files[file_key] = path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    program = str(row["program"]).upper()
+    GUI_data = {
+        "Gemini Key": api_key,
+        "Applicant Name": row["name"],
+        "Assessor Name": row["assessor"],
+        "Gender": str(row["gender"]).upper(),
+        "Traineeship": program,
+        "Files": files,
+        "Enable Thinking": _as_bool(row["enable_thinking"]) if row.get("enable_thinking") not in (None, "") else enable_thinking,
+    }
+    if program == 'ICP':
+        GUI_data["ICP_Info_Prompt3"] = row.get("icp_info_prompt3") or ""
+        GUI_data["ICP_Info_Prompt6a"] = row.get("icp_info_prompt6a") or ""
+        GUI_data["ICP_Info_Prompt6b"] = row.get("icp_info_prompt6b") or ""
+    return GUI_data
+
+def process_candidate(GUI_data):
+    """
+    Generates the report for one candidate in its own workspace.
+
+    Returns:
+        Summary dictionary with status, report path, stage timings and error (if any)
+    """
+    summary = {"name": GUI_data["Applicant Name"], "program": GUI_data["Traineeship"],
+               "status": "failed", "report": None, "timings": {}, "error": None}
+    start = time.time()
+    try:
+        with Workspace(prefix="candidate_") as workspace:
+            report = generate_report(GUI_data, workspace=workspace, timings=summary["timings"])
+        if report:
+            summary["status"] = "ok"
+            summary["report"] = report
+        else:
+            summary["error"] = "Failed to generate report."
+    except Exception as e:
+        print(f"Error processing {summary['name']}: {e}\n{traceback.format_exc()}")
+        summary["error"] = str(e)
+    finally:
+        summary["timings"]["total"] = time.time() - start
+    return summary
+
+def run_batch(rows, api_key, base_dir, workers=4, enable_thinking=False):
+    """
+    Generates reports for all manifest rows using a pool of workers.
+
+    Returns:
+        List of summary dictionaries, in manifest order
+    """
+    candidates = [build_gui_data(row, api_key, base_dir, enable_thinking) for row in rows]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(process_candidate, candidates))
+
+def print_summary(summaries, wall_time):
+    """Prints a table with the outcome and timings per candidate."""
+    print("\n=== Batch summary ===")
+    print(f"{'Candidate':<30} {'Status':<8} {'Redact':>8} {'Prompts':>8} {'Render':>8} {'Total':>8}")
+    for s in summaries:
+        t = s["timings"]
+        print(f"{s['name'][:30]:<30} {s['status']:<8} "
+              f"{t.get('redaction', 0):>7.1f}s {t.get('prompting', 0):>7.1f}s "
+              f"{t.get('rendering', 0):>7.1f}s {t.get('total', 0):>7.1f}s")
+    failures = [s for s in summaries if s["status"] != "ok"]
+    print(f"\n{len(summaries) - len(failures)}/{len(summaries)} reports generated in {wall_time:.1f}s")
+    for s in failures:
+        print(f"  FAILED {s['name']}: {s['error']}")
+
+def find_results_files(paths):
+    """
+    Expands the given files and directories into a list of results files.
+
+    Directories are searched (not recursively) for .json files; batch summaries are skipped.
+    """
+    results_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith('.json') and not name.startswith('batch_summary_'):
+                    results_files.append(os.path.join(path, name))
+        else:
+            results_files.append(path)
+    return results_files
+
+def render_results_file(results_path, candidate=None):
+    """
+    Re-renders the report of one results file in its own workspace.
+
+    Returns:
+        Summary dictionary with status, report path, render time and error (if any)
+    """
+    summary = {"results": results_path, "status": "failed", "report": None, "time": 0, "error": None}
+    start = time.time()
+    try:
+        with Workspace(prefix="render_") as workspace:
+            report = render_from_results(results_path, candidate, workspace=workspace)
+        if report:
+            summary["status"] = "ok"
+            summary["report"] = report
+        else:
+            summary["error"] = "Failed to generate report."
+    except Exception as e:
+        print(f"Error rendering {results_path}: {e}\n{traceback.format_exc()}")
+        summary["error"] = str(e)
+    finally:
+        summary["time"] = time.time() - start
+    return summary
+
+def render_main(argv):
+    parser = argparse.ArgumentParser(prog="batch.py render",
+                                     description="Re-render reports from saved results files without calling Gemini.")
+    parser.add_argument("paths", nargs="+", help="Results JSON files or directories containing them")
+    parser.add_argument("--workers", type=int, default=4, help="Number of reports rendered in parallel")
+    parser.add_argument("--name", help="Applicant name (for results files without stored candidate details)")
+    parser.add_argument("--assessor", help="Assessor name")
+    parser.add_argument("--gender", choices=["M", "F"], help="Gender")
+    parser.add_argument("--program", choices=["MCP", "DATA", "ICP"], help="Traineeship")
+    args = parser.parse_args(argv)
+
+    candidate = {"Applicant Name": args.name, "Assessor Name": args.assessor,
+                 "Gender": args.gender, "Traineeship": args.program}
+    results_files = find_results_files(args.paths)
+    print(f"Rendering {len(results_files)} reports with {args.workers} workers...")
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        summaries = list(executor.map(lambda path: render_results_file(path, candidate), results_files))
+    wall_time = time.time() - start
+
+    for s in summaries:
+        outcome = s["report"] if s["status"] == "ok" else f"FAILED: {s['error']}"
+        print(f"{os.path.basename(s['results'])[:40]:<40} {s['time']:>6.1f}s  {outcome}")
+    failures = [s for s in summaries if s["status"] != "ok"]
+    print(f"\n{len(summaries) - len(failures)}/{len(summaries)} reports rendered in {wall_time:.1f}s")
+    return 0 if not failures else 1
+
+def _read_api_key(cli_key):
+    if cli_key:
+        return cli_key
+    if os.environ.get("GEMINI_API_KEY"):
+        return os.environ["GEMINI_API_KEY"]
+    if os.path.exists(KEY_FILE):
+        with open(KEY_FILE, 'r') as f:
+            return f.read().strip()
+    return ""
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "render":
+        return render_main(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Generate assessment reports for a cohort of candidates.")
+    parser.add_argument("manifest", help="CSV or JSON file with one candidate per row")
+    parser.add_argument("--key", help="Gemini API key (default: $GEMINI_API_KEY or the key saved by the GUI)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of candidates processed in parallel")
+    parser.add_argument("--thinking", action="store_true", help="Enable AI thinking for all candidates")
+    parser.add_argument("--fake-model", action="store_true",
+                        help="Use the offline Gemini stand-in (no key or network needed, for load tests)")
+    parser.add_argument("--fake-latency", type=float, nargs=2, metavar=("MIN", "MAX"), default=(0.2, 1.0),
+                        help="Fake model latency range in seconds")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0,
+                        help="Share of fake model requests failing with 429/503")
+    parser.add_argument("--fake-quota", type=int, help="Fake model requests per minute before 429s")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Reuse cached Gemini responses for unchanged inputs (see response_cache.py)")
+    parser.add_argument("--pdf-backend", choices=pdf_text.BACKENDS, help="PDF text extraction backend (default: pymupdf)")
+    parser.add_argument("--requests-per-minute", type=int,
+                        help=f"Gemini requests per minute shared by all candidates, 0 for no limit "
+                             f"(default: {retry_policy.requests_per_minute}, the account quota)")
+    args = parser.parse_args(argv)
+
+    api_key = _read_api_key(args.key)
+    if args.fake_model:
+        model_client.default_backend = "fake"
+        model_client.fake_options = {"latency": tuple(args.fake_latency), "error_rate": args.fake_error_rate,
+                                     "quota_per_minute": args.fake_quota}
+    elif not api_key:
+        parser.error("No Gemini API key found. Pass --key or set GEMINI_API_KEY.")
+
+    if args.pdf_backend:
+        pdf_text.default_backend = args.pdf_backend
+    if args.response_cache:
+        prompting.use_response_cache = True
+    if args.requests_per_minute is not None:
+        retry_policy.requests_per_minute = args.requests_per_minute
+
+    rows = load_manifest(args.manifest)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    print(f"Processing {len(rows)} candidates with {args.workers} workers...")
+
+    start = time.time()
+    summaries = run_batch(rows, api_key, base_dir, workers=args.workers, enable_thinking=args.thinking)
+    wall_time = time.time() - start
+    print_summary(summaries, wall_time)
+
+    output_dir = "output_reports"
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, f"batch_summary_{datetime.now().strftime('%m%d%H%M')}.json")
+    with open(summary_path, 'w') as f:
+        json.dump({"wall_time": wall_time, "candidates": summaries}, f, indent=4)
+    print(f"Summary saved: {summary_path}")
+
+    return 0 if all(s["status"] == "ok" for s in summaries) else 1
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
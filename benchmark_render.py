@@ -0,0 +1,262 @@
+"""
+Render Benchmark
+
+Measures the cost of rendering a report (update_document of both writers)
+without calling Gemini. Synthetic results files of increasing size are
+rendered against the bundled templates; for every case the wall time,
+peak memory (tracemalloc) and the most expensive functions (cProfile) are
+reported, so rendering regressions show up before they reach assessors.
+
+With --check, every program is rendered once and the report is inspected
+instead (no placeholders left, icons and the candidate name present); the
+exit code is 1 if any report is wrong, so it can guard changes to the writers.
+
+Usage:
+    python benchmark_render.py [--sizes small medium large] [--programs MCP DATA]
+                               [--repeats 5] [--top 15] [--json results.json]
+    python benchmark_render.py --check [--programs MCP DATA]
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from docx import Document
+
+from report_utils import clean_up
+from template_index import TEMPLATE_PLACEHOLDER_PATTERN
+from workspace import Workspace
+import write_report_mcp as mcp_write_report
+import write_report_data as data_write_report
+
+# Paragraphs in the personality section and items in the conclusion lists per size
+SIZES = {
+    "small": {"bullets": 4, "sentences": 2, "conclusion_items": 4},
+    "medium": {"bullets": 8, "sentences": 4, "conclusion_items": 7},
+    "large": {"bullets": 30, "sentences": 8, "conclusion_items": 15},
+}
+
+WRITERS = {
+    "MCP": mcp_write_report,
+    "DATA": data_write_report,
+}
+
+SENTENCES = [
+    "Piet listened carefully to the other participants during the curious case.",
+    "He structured the business case clearly and explained his choices with confidence.",
+    "During the role play he stayed calm and looked for a solution that worked for everyone.",
+    "His PAPI profile shows a high need to finish tasks, which matches his thorough approach.",
+    "He could take the lead more often when the group loses focus.",
+    "Overall, Piet brings energy and a positive attitude to the team.",
+]
+
+def _text(rng, sentences):
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+def synthetic_results(size, program, seed=0):
+    """
+    Returns a results dictionary shaped like the JSON send_prompts writes.
+
+    Args:
+        size: Key of SIZES
+        program: "MCP" or "DATA"
+        seed: Seed for the random content (same seed = same results)
+    """
+    rng = random.Random(seed)
+    spec = SIZES[size]
+
+    # Personality section as produced by process_prompt_results: bullets separated by <<BREAK>> markers
+    bullets = [_text(rng, spec["sentences"]) for _ in range(spec["bullets"])]
+    personality = bullets[0] + "".join(f"<<BREAK>>• {bullet}" for bullet in bullets[1:])
+    personality += "<<BREAK>><<BREAK>>" + _text(rng, 3)
+
+    strengths = [f"Strength {i + 1}: {_text(rng, 1)}" for i in range(spec["conclusion_items"])]
+    improvements = [f"Development point {i + 1}: {_text(rng, 1)}" for i in range(spec["conclusion_items"])]
+
+    results = {
+        "prompt2_firstimpr": _text(rng, 2),
+        "prompt3_personality": personality,
+        "prompt4_cogcap_scores": json.dumps([rng.randint(1, 99) for _ in range(6)]),
+        "prompt4_cogcap_remarks": _text(rng, 3),
+        "prompt5_language": json.dumps(["C2", "B1", "C1"]),
+        "prompt6a_conqual": strengths,
+        "prompt6a_conqual_original": json.dumps(strengths),
+        "prompt6b_conimprov": improvements,
+        "prompt6b_conimprov_original": json.dumps(improvements),
+        "prompt9_interests": json.dumps(["Machine Learning", "Data Visualization", "Forecasting"]),
+    }
+    if program == "DATA":
+        results["prompt7_qualscore_data"] = json.dumps([rng.choice([-1, 0, 1, "N/A"]) for _ in range(23)])
+        results["prompt8_datatools"] = json.dumps([rng.choice([-1, 0, 1, "N/A"]) for _ in range(5)])
+    else:
+        results["prompt7_qualscore"] = json.dumps([rng.choice([-1, 0, 1]) for _ in range(20)])
+    results["_candidate"] = {"Applicant Name": "Piet Jansen", "Assessor Name": "Anna de Vries",
+                             "Gender": "M", "Traineeship": program}
+    return results
+
+def _render(writer, results_path, program, workspace):
+    clean_data = clean_up(results_path)
+    report = writer.update_document(clean_data, "Piet Jansen", "Anna de Vries", "M", program, workspace=workspace)
+    if not report:
+        raise RuntimeError("update_document did not produce a report")
+    return report
+
+def benchmark_case(program, size, repeats, top, work_dir):
+    """
+    Renders one program/size combination and returns its measurements.
+
+    The first render warms the template pool, template index and icon cache;
+    it is reported separately and not included in the timings.
+    """
+    writer = WRITERS[program]
+    results_path = os.path.join(work_dir, f"{program}_{size}.json")
+    with open(results_path, 'w') as f:
+        json.dump(synthetic_results(size, program), f)
+
+    with Workspace(base_dir=work_dir, output_dir=os.path.join(work_dir, "reports"), prefix="bench_") as workspace:
+        start = time.perf_counter()
+        _render(writer, results_path, program, workspace)
+        first = time.perf_counter() - start
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            _render(writer, results_path, program, workspace)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        _render(writer, results_path, program, workspace)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _render(writer, results_path, program, workspace)
+        profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (file_name, line, function), (_, calls, _, cumulative, _) in stats.stats.items():
+        functions.append({"function": f"{os.path.basename(file_name)}:{line}({function})",
+                          "calls": calls, "cumulative": cumulative})
+    functions.sort(key=lambda entry: -entry["cumulative"])
+
+    return {
+        "program": program,
+        "size": size,
+        "first_render": first,
+        "median": statistics.median(times) if times else first,
+        "min": min(times) if times else first,
+        "max": max(times) if times else first,
+        "peak_memory_mb": peak / (1024 * 1024),
+        "top_functions": functions[:top],
+    }
+
+def _report_texts(doc):
+    """Yields the text of every paragraph in the body, tables, headers and footers."""
+    def paragraphs(container):
+        for paragraph in container.paragraphs:
+            yield paragraph.text
+        for table in container.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    yield from paragraphs(cell)
+    yield from paragraphs(doc)
+    for section in doc.sections:
+        yield from paragraphs(section.header)
+        yield from paragraphs(section.footer)
+
+def check_render(program, work_dir):
+    """
+    Renders synthetic results for a program and inspects the report.
+
+    Returns:
+        List of problems found (empty if the report looks right)
+    """
+    results_path = os.path.join(work_dir, f"{program}_check.json")
+    with open(results_path, 'w') as f:
+        json.dump(synthetic_results("small", program), f)
+
+    with Workspace(base_dir=work_dir, output_dir=os.path.join(work_dir, "reports"), prefix="check_") as workspace:
+        try:
+            report = _render(WRITERS[program], results_path, program, workspace)
+        except Exception as e:
+            return [f"rendering failed: {type(e).__name__}: {e}"]
+        doc = Document(report)
+
+    problems = []
+    text = "\n".join(_report_texts(doc))
+    leftovers = sorted(set(TEMPLATE_PLACEHOLDER_PATTERN.findall(text)))
+    if leftovers:
+        problems.append(f"placeholders left in the report: {', '.join(leftovers)}")
+    if "Piet" not in text:
+        problems.append("candidate name missing")
+    if not doc.inline_shapes:
+        problems.append("no rating icons in the report")
+    return problems
+
+def run_checks(programs):
+    """Runs check_render for every program, prints the outcome and returns the exit code."""
+    work_dir = tempfile.mkdtemp(prefix="render_check_")
+    failed = False
+    try:
+        for program in programs:
+            problems = check_render(program, work_dir)
+            failed = failed or bool(problems)
+            print(f"{program}: {'OK' if not problems else 'FAILED'}")
+            for problem in problems:
+                print(f"  - {problem}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+def print_report(cases):
+    print(f"\n{'Program':<8} {'Size':<8} {'First':>8} {'Median':>8} {'Min':>8} {'Max':>8} {'Peak MB':>8}")
+    for case in cases:
+        print(f"{case['program']:<8} {case['size']:<8} {case['first_render']:>7.3f}s {case['median']:>7.3f}s "
+              f"{case['min']:>7.3f}s {case['max']:>7.3f}s {case['peak_memory_mb']:>8.1f}")
+    for case in cases:
+        print(f"\n--- {case['program']} / {case['size']}: most expensive functions (cumulative) ---")
+        for entry in case["top_functions"]:
+            print(f"{entry['cumulative']:>8.3f}s {entry['calls']:>7}  {entry['function']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark report rendering with synthetic results.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--programs", nargs="+", choices=list(WRITERS), default=list(WRITERS))
+    parser.add_argument("--repeats", type=int, default=5, help="Timed renders per case")
+    parser.add_argument("--top", type=int, default=15, help="Functions listed per case")
+    parser.add_argument("--json", help="Also write the measurements to this file")
+    parser.add_argument("--check", action="store_true", help="Only check that every program renders correctly")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return run_checks(args.programs)
+
+    work_dir = tempfile.mkdtemp(prefix="render_benchmark_")
+    try:
+        cases = []
+        for program in args.programs:
+            for size in args.sizes:
+                print(f"Benchmarking {program} / {size}...")
+                cases.append(benchmark_case(program, size, args.repeats, args.top, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(cases)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(cases, f, indent=2)
+        print(f"\nMeasurements saved: {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Context Cache Module
+
+Uploads the shared document context of a candidate run (notes, PAPI, cognitive
+test, context/tone documents and profile) once as Gemini cached content, so
+every prompt can reference it by name instead of re-sending the full text.
+"""
+import threading
+import time
+
+# Default lifetime of a cached context. A run is bounded by max_wait_time in
+# prompting.py, so this only needs to cover one candidate plus some slack.
+default_cache_ttl = 600  # seconds
+
+# Refresh the TTL when a cache is about to expire within this many seconds
+ttl_refresh_margin = 60  # seconds
+
+
+class ContextCache:
+    """
+    Lazily creates one cached-content handle per model for a context string.
+
+    The cache is created on first use, its TTL is extended when it gets close
+    to expiring, and all handles are deleted in cleanup(). If the API refuses
+    to cache the context (e.g. it is below the minimum cacheable size), get()
+    returns None and callers fall back to sending the context inline.
+    """
+
+    def __init__(self, client, context_text, ttl_seconds=default_cache_ttl, display_name=None):
+        self.client = client
+        self.context_text = context_text
+        self.ttl_seconds = ttl_seconds
+        self.display_name = display_name
+        self._caches = {}           # model -> {"name": ..., "expires_at": ...}
+        self._failed_models = set()  # models for which caching is unavailable
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+    def get(self, model):
+        """
+        Returns the cached-content name for the model, creating or refreshing it if needed.
+
+        Args:
+            model: The Gemini model the cached content will be used with
+
+        Returns:
+            The cached-content resource name, or None if caching is unavailable
+        """
+        # Prompts run concurrently; the lock makes sure only one upload happens
+        with self._lock:
+            if model in self._failed_models:
+                return None
+
+            entry = self._caches.get(model)
+            now = time.time()
+            if entry is None:
+                try:
+                    config = {
+                        "contents": [self.context_text],
+                        "ttl": f"{self.ttl_seconds}s",
+                    }
+                    if self.display_name:
+                        config["display_name"] = self.display_name
+                    cache = self.client.caches.create(model=model, config=config)
+                except Exception as e:
+                    print(f"Warning: Could not cache context for {model}, sending it inline instead: {e}")
+                    self._failed_models.add(model)
+                    return None
+                entry = {"name": cache.name, "expires_at": now + self.ttl_seconds}
+                self._caches[model] = entry
+                print(f"Created context cache {cache.name} for {model} (TTL {self.ttl_seconds}s)")
+            elif entry["expires_at"] - now < ttl_refresh_margin:
+                try:
+                    self.client.caches.update(name=entry["name"], config={"ttl": f"{self.ttl_seconds}s"})
+                    entry["expires_at"] = now + self.ttl_seconds
+                    print(f"Extended TTL of context cache {entry['name']}")
+                except Exception as e:
+                    print(f"Warning: Could not extend TTL of context cache {entry['name']}: {e}")
+            return entry["name"]
+
+    def cleanup(self):
+        """Deletes every cached-content handle created by this instance."""
+        with self._lock:
+            for model, entry in self._caches.items():
+                try:
+                    self.client.caches.delete(name=entry["name"])
+                    print(f"Deleted context cache {entry['name']} ({model})")
+                except Exception as e:
+                    # The cache expires on its own after the TTL, so this is not fatal
+                    print(f"Warning: Could not delete context cache {entry['name']}: {e}")
+            self._caches.clear()
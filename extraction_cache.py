@@ -0,0 +1,125 @@
+"""
+Extraction Cache Module
+
+On-disk cache for text extracted from PDF and DOCX files. Entries are keyed by
+the SHA-256 of the file contents plus the extractor name and version, so the
+static resources (context, tone of voice and profile documents) are parsed
+only once, and a changed file or extractor automatically gets a new entry.
+The cache is bounded in size; the least recently used entries are evicted first.
+"""
+import hashlib
+import os
+import threading
+
+# Location of the cache (per user, like the saved Gemini key)
+cache_dir = os.path.expanduser("~/.ormit_art_cache/extracted_text")
+
+# Maximum total size of all cached entries
+max_cache_bytes = 50 * 1024 * 1024
+
+# Set to False to always run the extractors
+enabled = True
+
+_evict_lock = threading.Lock()
+
+def file_hash(file_path):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex digest string
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _entry_path(digest, extractor_name, extractor_version):
+    key = hashlib.sha256(f"{digest}:{extractor_name}:{extractor_version}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.txt")
+
+def cached_extract(file_path, extractor, extractor_name, extractor_version):
+    """
+    Returns the extracted text of a file, running the extractor only on a cache miss.
+
+    Args:
+        file_path: Path to the file to extract
+        extractor: Callable taking the file path and returning the text.
+                   Exceptions are propagated and nothing is cached.
+        extractor_name: Name of the extractor (part of the cache key)
+        extractor_version: Version of the extractor (part of the cache key)
+
+    Returns:
+        The extracted text
+    """
+    if not enabled:
+        return extractor(file_path)
+
+    try:
+        entry = _entry_path(file_hash(file_path), extractor_name, extractor_version)
+    except OSError as e:
+        print(f"Warning: Could not hash {file_path} for the extraction cache: {e}")
+        return extractor(file_path)
+
+    try:
+        with open(entry, 'r', encoding='utf-8') as f:
+            text = f.read()
+        os.utime(entry)  # Mark as recently used for eviction
+        return text
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Warning: Could not read extraction cache entry {entry}: {e}")
+
+    text = extractor(file_path)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, entry)
+        _evict()
+    except OSError as e:
+        print(f"Warning: Could not write extraction cache entry for {file_path}: {e}")
+    return text
+
+def _evict():
+    """Removes the least recently used entries until the cache fits in max_cache_bytes."""
+    with _evict_lock:
+        entries = []
+        total = 0
+        for name in os.listdir(cache_dir):
+            if not name.endswith('.txt'):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+def clear():
+    """Removes all cached entries."""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass
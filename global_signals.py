@@ -2,6 +2,8 @@ from PyQt6.QtCore import pyqtSignal, QObject
 
 class GlobalSignals(QObject):
     update_message = pyqtSignal(str)
+    # Partial output of a streamed prompt: (prompt key, text received so far)
+    prompt_progress = pyqtSignal(str, str)
 
 # Create a global instance of the signals
 global_signals = GlobalSignals()
@@ -0,0 +1,236 @@
+"""
+Instrumentation Module
+
+Structured timing and token-usage tracing for report runs. A run opens a
+trace (start_trace); code wraps its stages in spans (span / traced), and
+Gemini calls attach their usage_metadata to the current span (record_usage).
+When the run ends the trace is saved as JSON, including aggregates per span
+name. aggregate_traces combines saved traces across runs:
+
+    python instrumentation.py output_reports/traces
+
+Spans outside an active trace cost next to nothing and are not recorded.
+The active trace and span are kept in context variables; work submitted to
+thread pools should be wrapped with bind() to stay in the run's trace.
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Token counts copied from a response's usage_metadata
+USAGE_FIELDS = {
+    "prompt_token_count": "input_tokens",
+    "candidates_token_count": "output_tokens",
+    "thoughts_token_count": "thinking_tokens",
+    "cached_content_token_count": "cached_tokens",
+    "total_token_count": "total_tokens",
+}
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)  # id of the open span
+
+class Trace:
+    """The spans of one run. Thread-safe."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def new_id(self):
+        """Returns the id for a new span."""
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+            return span_id
+
+    def add(self, name, duration, parent_id=None, attributes=None, start_offset=None, span_id=None):
+        """Records a finished span and returns it."""
+        if span_id is None:
+            span_id = self.new_id()
+        if start_offset is None:
+            start_offset = time.perf_counter() - self._start - duration
+        record = {
+            "id": span_id,
+            "parent": parent_id,
+            "name": name,
+            "start": start_offset,
+            "duration": duration,
+            "thread": threading.current_thread().name,
+            "attributes": attributes or {},
+        }
+        with self._lock:
+            self.spans.append(record)
+        return record
+
+    def aggregates(self):
+        """Returns per span name: count, total/min/max seconds and summed token counts."""
+        return _aggregate(self.spans)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        return {
+            "run_id": self.run_id,
+            "started": self.started,
+            "duration": time.perf_counter() - self._start,
+            "spans": spans,
+            "aggregates": _aggregate(spans),
+        }
+
+    def save(self, directory):
+        """Writes the trace to '<directory>/<run_id>.json' and returns the path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.run_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+def _aggregate(spans):
+    aggregates = {}
+    for record in spans:
+        entry = aggregates.setdefault(record["name"], {"count": 0, "total": 0.0, "min": None, "max": None})
+        entry["count"] += 1
+        entry["total"] += record["duration"]
+        entry["min"] = record["duration"] if entry["min"] is None else min(entry["min"], record["duration"])
+        entry["max"] = record["duration"] if entry["max"] is None else max(entry["max"], record["duration"])
+        for field in USAGE_FIELDS.values():
+            if isinstance(record["attributes"].get(field), int):
+                entry[field] = entry.get(field, 0) + record["attributes"][field]
+    return aggregates
+
+def start_trace(run_id):
+    """
+    Makes a new trace the active one in the current context.
+
+    Returns:
+        Tuple (trace, token); pass the token to end_trace
+    """
+    trace = Trace(run_id)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    """Restores the trace that was active before start_trace."""
+    _current_trace.reset(token)
+
+def current_trace():
+    """Returns the active trace, or None."""
+    return _current_trace.get()
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block of code as a span of the active trace.
+
+    Yields the span's attribute dictionary, so the block can add attributes.
+    An exception is recorded as the 'error' attribute and re-raised.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+
+    parent_id = _current_span.get()
+    span_id = trace.new_id()
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add(name, time.perf_counter() - start, parent_id=parent_id, attributes=attributes,
+                  start_offset=start - trace._start, span_id=span_id)
+
+def traced(name):
+    """Decorator that runs the function inside a span with the given name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def add_span(name, duration, **attributes):
+    """Records work timed elsewhere (e.g. in a worker process) as a span of the active trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration, parent_id=_current_span.get(), attributes=attributes)
+
+def record_usage(response, attributes):
+    """
+    Copies the token counts of a Gemini response's usage_metadata into span attributes.
+
+    Args:
+        response: A response (or the last stream chunk) from generate_content
+        attributes: The attribute dictionary yielded by span()
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for source, target in USAGE_FIELDS.items():
+        value = getattr(usage, source, None)
+        if value is not None:
+            attributes[target] = value
+
+def bind(function):
+    """Returns a callable that runs function in a copy of the current context (for thread pools)."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return wrapper
+
+def aggregate_traces(paths):
+    """
+    Combines saved traces into aggregates per span name.
+
+    Args:
+        paths: Trace JSON files or directories containing them
+
+    Returns:
+        Dictionary with the number of runs and the aggregates per span name
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json'))
+        else:
+            files.append(path)
+
+    spans = []
+    runs = 0
+    for file in files:
+        try:
+            with open(file, 'r') as f:
+                spans.extend(json.load(f)["spans"])
+            runs += 1
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Skipping trace {file}: {e}")
+    return {"runs": runs, "aggregates": _aggregate(spans)}
+
+def main(argv=None):
+    paths = (argv if argv is not None else sys.argv[1:]) or [os.path.join("output_reports", "traces")]
+    result = aggregate_traces(paths)
+    print(f"{result['runs']} runs")
+    print(f"{'Span':<36} {'Count':>6} {'Total':>9} {'Mean':>8} {'Max':>8} {'In tok':>9} {'Out tok':>8} {'Think':>7}")
+    for name, entry in sorted(result["aggregates"].items(), key=lambda item: -item[1]["total"]):
+        print(f"{name[:36]:<36} {entry['count']:>6} {entry['total']:>8.2f}s {entry['total'] / entry['count']:>7.2f}s "
+              f"{entry['max']:>7.2f}s {entry.get('input_tokens', 0):>9} {entry.get('output_tokens', 0):>8} "
+              f"{entry.get('thinking_tokens', 0):>7}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
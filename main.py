@@ -1,22 +1,18 @@
 import sys
 import os
 import traceback
+import multiprocessing
 from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (QApplication, QWidget, QPushButton, QLineEdit, QLabel,
                              QGridLayout, QFileDialog, QComboBox, QMessageBox, QCheckBox, QHBoxLayout)
 from PyQt6.QtGui import QPixmap, QFont, QIcon
-from redact import *
-from prompting import *
 from time import sleep
 from global_signals import global_signals
-from report_utils import clean_up, resource_path
+from report_utils import resource_path
+from pipeline import generate_report, render_from_results
 import stat
 
-# Import write_report modules (MCP and DATA)
-import write_report_mcp as mcp_write_report
-import write_report_data as data_write_report
-
 # Define paths for resources
 logo_path_abs = "resources/ormittalentV3.png"
 icon_path_abs = "resources/assessmentReport.ico"
@@ -25,6 +21,10 @@ logo_path = resource_path(logo_path_abs)
 icon_path = resource_path(icon_path_abs)
 
 programs = ['MCP', 'DATA', 'ICP']
+
+# Gemini requests per minute for the GUI's runs (None uses retry_policy.requests_per_minute, 0 means no limit)
+requests_per_minute = None
+
 genders = ['M', 'F']
 
 class ProcessingThread(QThread):
@@ -36,37 +36,8 @@ class ProcessingThread(QThread):
 
     def run(self):
         try:
-            # Create temp directory if it doesn't exist
-            if not os.path.exists('temp'):
-                os.makedirs('temp')
-                
-            # Check if all required files exist
-            for file_key, file_path in self.GUI_data["Files"].items():
-                if not os.path.exists(file_path):
-                    global_signals.update_message.emit(f"Error: File not found: {file_path}")
-                    return
-            
-            # Redact and store files
-            global_signals.update_message.emit("Redacting sensitive information...")
-            redact_folder(self.GUI_data)
-
-            # Send prompts to Gemini
-            global_signals.update_message.emit("Sending prompts to Gemini...")
-            output_path = send_prompts(self.GUI_data)
-
-            # Convert JSON to report
-            global_signals.update_message.emit("Generating report...")
-            clean_data = clean_up(output_path)
-            selected_program = self.GUI_data["Traineeship"]
-            
-            if selected_program == 'MCP' or selected_program == 'ICP':
-                updated_doc = mcp_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"])
-            elif selected_program == 'DATA':
-                updated_doc = data_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"])
-            else:
-                # Default fallback (can remain MCP or be made more specific if needed)
-                global_signals.update_message.emit(f"Warning: Unknown program '{selected_program}', defaulting to MCP report.")
-                updated_doc = mcp_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"])
+            # Redact, prompt and render the report
+            updated_doc = generate_report(self.GUI_data)
 
             if updated_doc:
                 global_signals.update_message.emit(f"Report generated successfully: {updated_doc}")
@@ -81,6 +52,29 @@ class ProcessingThread(QThread):
             print(f"Error in processing thread: {e}\n{traceback_str}")
             global_signals.update_message.emit(f"Error: {str(e)}")
 
+class RenderThread(QThread):
+    """Re-renders a report from a saved results file (no Gemini calls)."""
+    processing_completed = pyqtSignal(str)
+
+    def __init__(self, results_path):
+        super().__init__()
+        self.results_path = results_path
+
+    def run(self):
+        try:
+            updated_doc = render_from_results(self.results_path)
+
+            if updated_doc:
+                global_signals.update_message.emit(f"Report generated successfully: {updated_doc}")
+                self.processing_completed.emit(updated_doc)
+            else:
+                global_signals.update_message.emit("Error: Failed to generate report.")
+
+        except Exception as e:
+            traceback_str = traceback.format_exc()
+            print(f"Error in render thread: {e}\n{traceback_str}")
+            global_signals.update_message.emit(f"Error: {str(e)}")
+
 class MainWindow(QWidget):
     KEY_FILE = os.path.expanduser("~/.ormit_gemini_key")
     
@@ -106,6 +100,7 @@ class MainWindow(QWidget):
         self.msg_box.button(QMessageBox.StandardButton.Close).clicked.connect(self.close_application)
 
         global_signals.update_message.connect(self.refresh_message_box)
+        global_signals.prompt_progress.connect(self.show_prompt_progress)
 
         # Load the logo
         pixmap = QPixmap(logo_path)
@@ -294,6 +289,12 @@ Cons: Slower response, higher cost.""")
         layout.addWidget(self.submitbtn, 14, 2, Qt.AlignmentFlag.AlignRight)
         self.submitbtn.clicked.connect(self.handle_submit)
 
+        # Re-render a report from an earlier results file
+        self.renderbtn = QPushButton('Re-render from results...')
+        self.renderbtn.setToolTip('Regenerate a report from a saved results (.json) file without calling Gemini')
+        layout.addWidget(self.renderbtn, 14, 0)
+        self.renderbtn.clicked.connect(self.handle_render)
+
         # Initialize UI based on default selection
         self.handle_program_change()
 
@@ -305,6 +306,13 @@ Cons: Slower response, higher cost.""")
         # Force update of the UI
         QApplication.processEvents()
 
+    def show_prompt_progress(self, prompt, text):
+        # Show the personality section while it is being written
+        if prompt == 'prompt3_personality':
+            preview = text if len(text) <= 600 else "..." + text[-600:]
+            self.msg_box.setInformativeText(preview)
+            QApplication.processEvents()
+
     def close_application(self):
         # This will close the application when the messagebox is closed manually
         QApplication.quit()
@@ -421,7 +429,9 @@ Cons: Slower response, higher cost.""")
             "Gender": self.gender_combo.currentText(),
             "Traineeship": selected_program,
             "Files": self.selected_files.copy(),
-            "Enable Thinking": self.enable_thinking_checkbox.isChecked()
+            "Enable Thinking": self.enable_thinking_checkbox.isChecked(),
+            "Stream Responses": True,  # Show partial output while the prompts run
+            "Requests Per Minute": requests_per_minute
         }
 
         # Add ICP-specific data and validation
@@ -444,6 +454,19 @@ Cons: Slower response, higher cost.""")
         self.processing_thread.processing_completed.connect(self.on_processing_completed)
         self.processing_thread.start()
 
+    def handle_render(self):
+        results_path, _ = QFileDialog.getOpenFileName(self, "Select results file", "output_reports",
+                                                      "Results Files (*.json);;All Files (*)")
+        if not results_path:
+            return
+
+        self.msg_box.setText("Re-rendering report...")
+        self.msg_box.show()
+
+        self.processing_thread = RenderThread(results_path)
+        self.processing_thread.processing_completed.connect(self.on_processing_completed)
+        self.processing_thread.start()
+
     def on_processing_completed(self, updated_doc):
         self.msg_box.close()
         if updated_doc and os.path.exists(updated_doc):
@@ -454,6 +477,8 @@ Cons: Slower response, higher cost.""")
 
 
 if __name__ == '__main__':
+    # Needed for the PDF extraction worker processes in the bundled executable
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
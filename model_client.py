@@ -0,0 +1,272 @@
+"""
+Model Client Module
+
+Creates the client the prompting stage talks to. A model client offers the
+part of the google-genai client surface this application uses:
+
+    client.models.generate_content(model=, contents=, config=)  -> response (.text, .usage_metadata)
+    client.models.generate_content_stream(model=, contents=, config=)  -> iterable of chunks
+    client.models.count_tokens(model=, contents=)  -> result (.total_tokens)
+    client.caches.create(model=, config=) -> cached content (.name)
+    client.caches.update(name=, config=) / client.caches.delete(name=)
+
+Two backends exist: "gemini" (the real google-genai client) and "fake", an
+offline stand-in that answers every prompt with a generated response after a
+configurable latency, fails a configurable share of requests with 429/503
+errors and reports token counts. The fake lets the whole pipeline
+(redaction, prompting, rendering) run without network access or an API key,
+e.g. for load tests of the concurrency settings.
+"""
+import ast
+import json
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+# Backend used when GUI_data has no "Model Backend"
+default_backend = "gemini"
+
+# FakeModelClient options used when GUI_data has no "Fake Model Options"
+fake_options = {}
+
+BACKENDS = ("gemini", "fake")
+
+# Input token limit the fake models report (that of the Gemini 2.x models)
+FAKE_INPUT_TOKEN_LIMIT = 1048576
+
+# Fake response generators, matched against the prompt text in order
+FAKE_RESPONSES = [
+    ("percentile scores", lambda rng: str([rng.randint(1, 99) for _ in range(6)])),
+    ("Capacity test results", lambda rng: "Piet scored above average on general ability. He worked fast and accurately, with his best result on the abstract test."),
+    ("personality description", lambda rng: "Piet has a background in economics and is motivated to grow into a leadership role.\n\n"
+        + "\n".join(f"* Trait {i + 1}: Piet showed this consistently during the role play and the business case." for i in range(5))
+        + "\n\nOverall, Piet is a motivated and thoughtful trainee who will be a valuable addition to the team."),
+    ("first impression", lambda rng: "Piet came across as calm, friendly and well prepared, with an open and attentive communication style."),
+    ("language levels", lambda rng: str([rng.choice(["B2", "C1", "C2"]), rng.choice(["A2", "B1", "B2"]), rng.choice(["C1", "C2"])])),
+    ("*strengths*", lambda rng: str([f"Strength {i + 1}: Piet showed this during several assessment steps." for i in range(6)])),
+    ("*development points*", lambda rng: str([f"Development point {i + 1}: Piet can grow here by asking for feedback." for i in range(4)])),
+    ("20 numbers", lambda rng: str([rng.choice([-1, 0, 1]) for _ in range(20)])),
+    ("23 items", lambda rng: str([rng.choice([-1, 0, 1, "N/A"]) for _ in range(23)])),
+    ("data skill proficiency", lambda rng: str([rng.choice([-1, 0, 1, "N/A"]) for _ in range(5)])),
+    ("data-related interests", lambda rng: str(["Machine Learning", "Data Visualization", "Forecasting"])),
+]
+
+class FakeAPIError(Exception):
+    """Error raised by the fake backend, shaped like google-genai's APIError (has .code and .details)."""
+
+    def __init__(self, code, message, retry_delay=None):
+        self.code = code
+        self.details = {"error": {"code": code, "message": message}}
+        if retry_delay is not None:
+            self.details["error"]["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                                 "retryDelay": f"{retry_delay}s"}]
+        super().__init__(f"{code} {message}. {self.details}")
+
+def _token_count(text):
+    # Rough estimate: about four characters per token
+    return max(1, len(text) // 4)
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_prompt_text(item) for item in contents)
+    return str(contents)
+
+# Phrases that start the document part of a prompt (see prompting.attach_context)
+CONTEXT_MARKERS = ("Use the following files", "Use the files provided")
+
+def _instructions(prompt):
+    """Returns the instruction part of a prompt, without the attached documents."""
+    for marker in CONTEXT_MARKERS:
+        position = prompt.find(marker)
+        if position != -1:
+            prompt = prompt[:position]
+    return prompt
+
+def _json_value(text):
+    """Returns a generated list answer as a JSON-ready list ("N/A" as None), or the text itself."""
+    try:
+        items = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+    if isinstance(items, list):
+        return [None if item == "N/A" else item for item in items]
+    return text
+
+def _field_sections(prompt, fields):
+    """Splits a combined prompt into the part following each field name's first quoted mention."""
+    starts = sorted((prompt.find(f'"{field}"'), field) for field in fields if f'"{field}"' in prompt)
+    return {field: prompt[start:starts[i + 1][0] if i + 1 < len(starts) else len(prompt)]
+            for i, (start, field) in enumerate(starts)}
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        return self._client._respond(model, contents, config or {})
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self._client._respond(model, contents, config or {})
+        text = response.text
+        chunk_size = max(1, len(text) // 5)
+        for start in range(0, len(text), chunk_size):
+            time.sleep(self._client.stream_chunk_delay)
+            last = start + chunk_size >= len(text)
+            yield SimpleNamespace(text=text[start:start + chunk_size],
+                                  usage_metadata=response.usage_metadata if last else None)
+
+    def count_tokens(self, model, contents, config=None):
+        return SimpleNamespace(total_tokens=_token_count(_prompt_text(contents)))
+
+    def get(self, model, config=None):
+        return SimpleNamespace(name=f"models/{model}", input_token_limit=FAKE_INPUT_TOKEN_LIMIT)
+
+class _FakeCaches:
+    def __init__(self, client):
+        self._client = client
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.contents = {}  # cache name -> cached text
+
+    def create(self, model, config=None):
+        with self._lock:
+            self._counter += 1
+            name = f"cachedContents/fake-{self._counter}"
+        self.contents[name] = _prompt_text((config or {}).get("contents", ""))
+        return SimpleNamespace(name=name, model=model)
+
+    def update(self, name, config=None):
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        self.contents.pop(name, None)
+
+class FakeModelClient:
+    """
+    Offline stand-in for the Gemini client.
+
+    Args:
+        latency: (min, max) seconds each request takes
+        error_rate: Share of requests that fail with a transient error (0-1)
+        rate_limit_share: Share of those failures that are 429 (the rest are 503)
+        quota_per_minute: If set, requests beyond this many per minute get a 429
+        responses: Optional list of (prompt phrase, generator) pairs tried before FAKE_RESPONSES;
+                   a generator is a string or a callable taking a random.Random
+        stream_chunk_delay: Seconds between streamed chunks
+        seed: Seed for the random latency, errors and generated responses
+    """
+
+    def __init__(self, latency=(0.2, 1.0), error_rate=0.0, rate_limit_share=0.7, quota_per_minute=None,
+                 responses=None, stream_chunk_delay=0.05, seed=None):
+        self.latency = tuple(latency)
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.quota_per_minute = quota_per_minute
+        self.responses = list(responses or []) + FAKE_RESPONSES
+        self.stream_chunk_delay = stream_chunk_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()  # times of requests in the last minute
+        self.request_count = 0
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+
+    def _check_quota(self):
+        with self._lock:
+            self.request_count += 1
+            if self.quota_per_minute is None:
+                return
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.quota_per_minute:
+                retry_delay = max(1, int(60 - (now - self._recent[0])))
+                raise FakeAPIError(429, "RESOURCE_EXHAUSTED: quota exceeded (fake backend)", retry_delay)
+            self._recent.append(now)
+
+    def _generate(self, prompt, seed):
+        for phrase, generator in self.responses:
+            if phrase in prompt:
+                return generator(random.Random(seed)) if callable(generator) else generator
+        return "OK"
+
+    def _respond(self, model, contents, config):
+        self._check_quota()
+        with self._lock:
+            delay = self._rng.uniform(*self.latency)
+            fails = self._rng.random() < self.error_rate
+            rate_limited = self._rng.random() < self.rate_limit_share
+            seed = self._rng.random()
+        time.sleep(delay)
+        if fails:
+            if rate_limited:
+                raise FakeAPIError(429, "RESOURCE_EXHAUSTED (fake backend)", retry_delay=1)
+            raise FakeAPIError(503, "UNAVAILABLE (fake backend)")
+
+        prompt = _prompt_text(contents)
+        # Only the instructions pick the response: the documents mention other prompts' phrases
+        instructions = _instructions(prompt)
+        structured = config.get("response_mime_type") == "application/json"
+        properties = (config.get("response_schema") or {}).get("properties")
+        if structured and properties:
+            # Object schema (combined extraction): answer each field from its own part of the prompt
+            text = json.dumps({field: _json_value(self._generate(section, seed))
+                               for field, section in _field_sections(instructions, properties).items()})
+        else:
+            text = self._generate(instructions, seed)
+            if structured:
+                # Structured output: answer lists as JSON, with "N/A" as null
+                value = _json_value(text)
+                if isinstance(value, list):
+                    text = json.dumps(value)
+
+        cached_tokens = 0
+        if config.get("cached_content"):
+            cached_tokens = _token_count(self.caches.contents.get(config["cached_content"], ""))
+        thinking = config.get("thinking_config") or {}
+        usage = SimpleNamespace(
+            prompt_token_count=_token_count(prompt) + cached_tokens,
+            candidates_token_count=_token_count(text),
+            thoughts_token_count=min(thinking.get("thinking_budget", 0), 4 * _token_count(text)) or None,
+            cached_content_token_count=cached_tokens or None,
+        )
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count + (usage.thoughts_token_count or 0)
+        return SimpleNamespace(text=text, usage_metadata=usage, model_version=model)
+
+_fake_clients = {}  # options -> shared FakeModelClient
+_fake_lock = threading.Lock()
+
+def create_client(backend=None, api_key=None, options=None):
+    """
+    Creates a model client.
+
+    Fake clients are shared per set of options, so their quota applies to all
+    concurrent candidates in the process, like the real API's quota does.
+
+    Args:
+        backend: "gemini" or "fake" (default: default_backend)
+        api_key: Gemini API key (not needed for the fake backend)
+        options: Keyword arguments for FakeModelClient (fake backend only, default: fake_options)
+
+    Returns:
+        The client
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = backend or default_backend
+    if backend == "gemini":
+        from google import genai
+        return genai.Client(api_key=api_key)
+    if backend == "fake":
+        options = dict(fake_options if options is None else options)
+        key = repr(sorted(options.items()))
+        with _fake_lock:
+            if key not in _fake_clients:
+                _fake_clients[key] = FakeModelClient(**options)
+            return _fake_clients[key]
+    raise ValueError(f"Unknown model backend '{backend}' (use one of: {', '.join(BACKENDS)})")
@@ -0,0 +1,136 @@
+"""
+Model Routing Module
+
+Decides which Gemini model answers each prompt. The routing table maps a
+prompt (optionally per program) to a primary model, its thinking budget and
+fallback models: short deterministic extractions go to a fast, cheap model,
+the personality and conclusion prompts to a stronger one. When the model of
+a request keeps failing (errors, timeouts, unknown model), the request moves
+on to the next model of its route. Latency and failures are tracked per
+route and model in route_stats.
+"""
+import threading
+from collections import deque
+
+# Model for prompts without a route of their own
+default_model = "gemini-2.5-flash-preview-04-17"
+
+# Fast, cheap model for deterministic extractions
+fast_model = "gemini-2.0-flash-lite"
+
+# Stronger model for the written sections
+strong_model = "gemini-2.5-pro-preview-05-06"
+
+# Fallback models of prompts without a route of their own
+default_fallbacks = ["gemini-2.0-flash"]
+
+# Thinking budget used for prompts in prompting.thinking_prompts without a route of their own
+default_thinking_budget = 8096
+
+# Consecutive transient errors on one model before moving to the next
+# (permanent errors such as an unknown model move on immediately)
+fallback_after_errors = 2
+
+# Latencies kept per route and model for the percentiles
+max_latency_samples = 500
+
+# Route per (prompt, program); program None applies to every program.
+# thinking_budget is used when thinking is enabled (None = no thinking).
+routing_table = {
+    ('prompt4_cogcap_scores', None): {"model": fast_model, "thinking_budget": None, "fallbacks": [default_model]},
+    ('prompt5_language', None): {"model": fast_model, "thinking_budget": None, "fallbacks": [default_model]},
+    ('prompt8_datatools', None): {"model": fast_model, "thinking_budget": None, "fallbacks": [default_model]},
+    ('prompt9_interests', None): {"model": fast_model, "thinking_budget": None, "fallbacks": [default_model]},
+    ('combined_extraction', None): {"model": fast_model, "thinking_budget": None, "fallbacks": [default_model]},
+    ('prompt3_personality', None): {"model": strong_model, "thinking_budget": 8096, "fallbacks": [default_model]},
+    ('prompt6a_conqual', None): {"model": strong_model, "thinking_budget": 8096, "fallbacks": [default_model]},
+    ('prompt6b_conimprov', None): {"model": strong_model, "thinking_budget": 8096, "fallbacks": [default_model]},
+}
+
+def supports_thinking(model):
+    """Returns True if the model accepts a thinking_config (the 2.5 models)."""
+    return model.startswith("gemini-2.5")
+
+def get_route(prom, program=None, thinking_budget=None):
+    """
+    Returns the route of a prompt.
+
+    Args:
+        prom: Prompt key (e.g. 'prompt4_cogcap_scores')
+        program: Traineeship program; a route for (prom, program) wins over (prom, None)
+        thinking_budget: Thinking budget when the prompt has no route of its own
+
+    Returns:
+        Dictionary with the route's "name", its "models" (primary first, then
+        the fallbacks) and its "thinking_budget"
+    """
+    if (prom, program) in routing_table:
+        entry, name = routing_table[(prom, program)], f"{prom}/{program}"
+    elif (prom, None) in routing_table:
+        entry, name = routing_table[(prom, None)], prom
+    else:
+        entry = {"model": default_model, "thinking_budget": thinking_budget, "fallbacks": default_fallbacks}
+        name = f"{prom} (default)"
+
+    models = []
+    for model in [entry["model"]] + list(entry.get("fallbacks", [])):
+        if model not in models:
+            models.append(model)
+    return {"name": name, "models": models, "thinking_budget": entry.get("thinking_budget")}
+
+def thinking_budget(route, model):
+    """Returns the thinking budget for a request of the route to model, or None for no thinking."""
+    return route["thinking_budget"] if supports_thinking(model) else None
+
+class RouteStats:
+    """Request latencies and failures per route and model. Thread-safe."""
+
+    def __init__(self, max_samples=max_latency_samples):
+        self.max_samples = max_samples
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, model, seconds, success):
+        """Records one request of a route to a model."""
+        with self._lock:
+            entry = self._entries.setdefault((route, model), {
+                "requests": 0, "errors": 0, "latencies": deque(maxlen=self.max_samples)})
+            entry["requests"] += 1
+            if success:
+                entry["latencies"].append(seconds)
+            else:
+                entry["errors"] += 1
+
+    def summary(self):
+        """Returns {route: {model: requests, errors, mean, p50, p95 and max seconds of successful requests}}."""
+        with self._lock:
+            entries = {key: (entry["requests"], entry["errors"], sorted(entry["latencies"]))
+                       for key, entry in self._entries.items()}
+        summary = {}
+        for (route, model), (requests, errors, latencies) in entries.items():
+            stats = {"requests": requests, "errors": errors}
+            if latencies:
+                stats.update({
+                    "mean": sum(latencies) / len(latencies),
+                    "p50": latencies[len(latencies) // 2],
+                    "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    "max": latencies[-1],
+                })
+            summary.setdefault(route, {})[model] = stats
+        return summary
+
+    def report(self):
+        """Prints the summary as a table."""
+        print(f"{'Route':<32} {'Model':<32} {'Req':>5} {'Err':>4} {'Mean':>7} {'p50':>7} {'p95':>7}")
+        for route, models in sorted(self.summary().items()):
+            for model, stats in models.items():
+                latency = "".join(f" {stats[key]:>6.2f}s" for key in ("mean", "p50", "p95")) if "mean" in stats \
+                    else f" {'-':>7} {'-':>7} {'-':>7}"
+                print(f"{route[:32]:<32} {model[:32]:<32} {stats['requests']:>5} {stats['errors']:>4}{latency}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Shared by all prompts and candidates in the process
+route_stats = RouteStats()
@@ -0,0 +1,77 @@
+"""
+PDF Text Module
+
+Extracts the text of PDF files. The default backend is PyMuPDF (fitz), which
+redact.py already uses and which is faster and more accurate than PyPDF2.
+The PyPDF2 backend is kept so the output of both can be compared. Long PDFs
+are split into page ranges that are extracted in parallel processes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Backend used when none is given: "pymupdf" or "pypdf2"
+default_backend = "pymupdf"
+
+# PDFs with at least this many pages are extracted in parallel (PyMuPDF only)
+parallel_page_threshold = 40
+
+# Maximum number of worker processes for parallel extraction
+max_workers = min(4, os.cpu_count() or 1)
+
+BACKENDS = ("pymupdf", "pypdf2")
+
+def _pymupdf_page_range(file_path, first_page, last_page):
+    """Returns the text of pages [first_page, last_page) as a list of strings."""
+    import fitz
+    with fitz.open(file_path) as doc:
+        return [doc[page_no].get_text() for page_no in range(first_page, last_page)]
+
+def _extract_pymupdf(file_path):
+    import fitz
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        if page_count < parallel_page_threshold or max_workers < 2:
+            pages = [page.get_text() for page in doc]
+            return "\n".join(pages) + "\n" if pages else ""
+
+    # Each worker opens the file itself and extracts one contiguous page range
+    chunk = -(-page_count // max_workers)
+    ranges = [(first, min(first + chunk, page_count)) for first in range(0, page_count, chunk)]
+    pages = []
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(_pymupdf_page_range, file_path, first, last) for first, last in ranges]
+        for future in futures:
+            pages.extend(future.result())
+    return "\n".join(pages) + "\n"
+
+def _extract_pypdf2(file_path):
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        pages = [page.extract_text() for page in reader.pages]
+    return "\n".join(pages) + "\n" if pages else ""
+
+_EXTRACTORS = {
+    "pymupdf": _extract_pymupdf,
+    "pypdf2": _extract_pypdf2,
+}
+
+def extract_text(file_path, backend=None):
+    """
+    Extracts the text of a PDF file.
+
+    Args:
+        file_path: Path to the PDF
+        backend: "pymupdf" or "pypdf2" (default: default_backend)
+
+    Returns:
+        The text of all pages, each followed by a newline
+
+    Raises:
+        ValueError: If the backend is unknown
+        Exception: Any error raised while reading the PDF
+    """
+    backend = backend or default_backend
+    if backend not in _EXTRACTORS:
+        raise ValueError(f"Unknown PDF backend '{backend}' (use one of: {', '.join(BACKENDS)})")
+    return _EXTRACTORS[backend](file_path)
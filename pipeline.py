@@ -0,0 +1,144 @@
+"""
+Pipeline Module
+
+Runs the full report generation for one candidate: redaction, prompting and
+rendering of the Word report. Shared by the GUI (main.py) and the headless
+batch mode (batch.py). render_from_results re-renders a report from a saved
+results file without calling Gemini.
+"""
+import os
+import time
+
+import instrumentation
+
+from global_signals import global_signals
+from redact import redact_folder
+from prompting import send_prompts, CANDIDATE_KEYS
+from report_utils import clean_up
+from workspace import Workspace
+
+# Import write_report modules (MCP and DATA)
+import write_report_mcp as mcp_write_report
+import write_report_data as data_write_report
+
+def render_report(clean_data, GUI_data, workspace=None):
+    """
+    Renders the Word report for the selected program from cleaned prompt results.
+
+    Args:
+        clean_data: Dictionary with cleaned prompt results (see report_utils.clean_up)
+        GUI_data: Dictionary with the candidate details (names, gender, program)
+        workspace: Optional Workspace that decides where the report is saved
+
+    Returns:
+        Path to the generated report, or None on failure
+    """
+    selected_program = GUI_data["Traineeship"]
+    args = (clean_data, GUI_data["Applicant Name"], GUI_data["Assessor Name"], GUI_data["Gender"], GUI_data["Traineeship"])
+
+    if selected_program == 'MCP' or selected_program == 'ICP':
+        return mcp_write_report.update_document(*args, workspace=workspace)
+    elif selected_program == 'DATA':
+        return data_write_report.update_document(*args, workspace=workspace)
+    else:
+        # Default fallback (can remain MCP or be made more specific if needed)
+        global_signals.update_message.emit(f"Warning: Unknown program '{selected_program}', defaulting to MCP report.")
+        return mcp_write_report.update_document(*args, workspace=workspace)
+
+def generate_report(GUI_data, workspace=None, timings=None):
+    """
+    Generates the assessment report for one candidate.
+
+    Args:
+        GUI_data: Dictionary with the candidate details, Gemini key and input files
+        workspace: The run's Workspace. If None, a new one is created in temp/
+                   and removed again when the report is done.
+        timings: Optional dictionary that receives the duration (seconds) of each stage
+
+    Returns:
+        Path to the generated report, or None if rendering failed
+
+    Raises:
+        FileNotFoundError: If one of the input files does not exist
+    """
+    if timings is None:
+        timings = {}
+
+    # Check if all required files exist
+    for file_key, file_path in GUI_data["Files"].items():
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+    owns_workspace = workspace is None
+    if owns_workspace:
+        workspace = Workspace()
+
+    # Spans of this run, saved to <output_dir>/traces/<run id>.json
+    trace, trace_token = instrumentation.start_trace(workspace.run_id)
+    try:
+        # Redact and store files
+        global_signals.update_message.emit("Redacting sensitive information...")
+        stage_start = time.time()
+        with instrumentation.span("redact_folder"):
+            redact_folder(GUI_data, workspace)
+            for file_key, seconds in workspace.redaction_timings.items():
+                instrumentation.add_span("redact_file", seconds, file=file_key)
+        timings["redaction"] = time.time() - stage_start
+        timings["redaction_per_file"] = dict(workspace.redaction_timings)
+
+        # Send prompts to Gemini
+        global_signals.update_message.emit("Sending prompts to Gemini...")
+        stage_start = time.time()
+        with instrumentation.span("send_prompts"):
+            output_path = send_prompts(GUI_data, workspace)
+        timings["prompting"] = time.time() - stage_start
+
+        # Convert JSON to report
+        global_signals.update_message.emit("Generating report...")
+        stage_start = time.time()
+        with instrumentation.span("clean_up"):
+            clean_data = clean_up(output_path)
+        with instrumentation.span("render_report", program=GUI_data["Traineeship"]):
+            updated_doc = render_report(clean_data, GUI_data, workspace)
+        timings["rendering"] = time.time() - stage_start
+    finally:
+        instrumentation.end_trace(trace_token)
+        try:
+            print(f"Trace saved: {trace.save(os.path.join(workspace.output_dir, 'traces'))}")
+        except OSError as e:
+            print(f"Warning: Could not save trace: {e}")
+        if owns_workspace:
+            workspace.cleanup()
+
+    return updated_doc
+
+def render_from_results(results_path, candidate=None, workspace=None):
+    """
+    Renders the report again from a saved results JSON, without calling Gemini.
+
+    Args:
+        results_path: Path to a results file written by send_prompts
+        candidate: Optional dictionary with the candidate details (see
+                   prompting.CANDIDATE_KEYS); overrides the details stored in
+                   the results file, needed for files saved before they were stored
+        workspace: Optional Workspace that decides where the report is saved
+
+    Returns:
+        Path to the generated report, or None if rendering failed
+
+    Raises:
+        FileNotFoundError: If the results file does not exist
+        ValueError: If the candidate details are missing
+    """
+    if not os.path.exists(results_path):
+        raise FileNotFoundError(f"File not found: {results_path}")
+
+    clean_data = clean_up(results_path)
+    details = dict(clean_data.get("_candidate") or {})
+    details.update({key: value for key, value in (candidate or {}).items() if value})
+    missing = [key for key in CANDIDATE_KEYS if not details.get(key)]
+    if missing:
+        raise ValueError(f"{os.path.basename(results_path)} has no {', '.join(missing)}; pass them explicitly.")
+
+    global_signals.update_message.emit(f"Re-rendering report for {details['Applicant Name']}...")
+    return render_report(clean_data, details, workspace)
@@ -1,39 +1,56 @@
-from google import genai
 import time
 from datetime import datetime
 import json
 from global_signals import global_signals
 import re
 import os
-import PyPDF2
 from docx import Document
 import ast
+from concurrent.futures import ThreadPoolExecutor
+from context_cache import ContextCache, default_cache_ttl
+from extraction_cache import cached_extract
+import response_cache
+from retry_policy import RetryPolicy, get_limiter
+import instrumentation
+from model_client import create_client
+import token_budget
+import model_routing
+import pdf_text
+
+# Set the default Gemini model (the model of each prompt is chosen in model_routing.py)
+default_model = model_routing.default_model
+
+# Bump these when the extraction logic changes, so cached text is re-extracted
+PDF_EXTRACTOR_VERSION = 1
+DOCX_EXTRACTOR_VERSION = 1
+
+def _extract_docx_text(file_path):
+    """Extracts the paragraph text of a DOCX file (raises on errors)."""
+    doc = Document(file_path)
+    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs)
+
+def read_pdf(file_path, backend=None):
+    """
+    Reads and returns text from a PDF file (cached by file hash and backend).
 
-# Set the default Gemini model for all prompts
-default_model = "gemini-2.5-flash-preview-04-17"
-
-def read_pdf(file_path):
-    """Reads and returns text from a PDF file."""
-    text = ""
+    The backend is "pymupdf" (default) or "pypdf2", see pdf_text.py.
+    """
+    backend = backend or pdf_text.default_backend
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
+        with instrumentation.span("read_pdf", file=os.path.basename(file_path), backend=backend):
+            return cached_extract(file_path, lambda path: pdf_text.extract_text(path, backend),
+                                  backend, PDF_EXTRACTOR_VERSION)
     except Exception as e:
         print(f"Error reading PDF {file_path}: {e}")
-    return text
+        return ""
 
 def read_docx(file_path):
-    """Reads and returns text from a DOCX file."""
-    text = ""
+    """Reads and returns text from a DOCX file (cached by file hash)."""
     try:
-        doc = Document(file_path)
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+        return cached_extract(file_path, _extract_docx_text, "python-docx", DOCX_EXTRACTOR_VERSION)
     except Exception as e:
         print(f"Error reading DOCX {file_path}: {e}")
-    return text
+        return ""
 
 def _extract_list_from_string(text):
     """
@@ -53,6 +70,9 @@ def _extract_list_from_string(text):
 
 max_wait_time = 200
 
+# GUI_data keys stored with the results, needed to render the report again
+CANDIDATE_KEYS = ["Applicant Name", "Assessor Name", "Gender", "Traineeship"]
+
 # Dictionary containing prompts with their respective temperatures
 prompts_with_temps = {
     'prompt2_firstimpr': {
@@ -409,43 +429,413 @@ Example with no interests: "["N/A"]"
     },
 }
 
-def send_prompts(data):
+# Maximum number of prompts sent to Gemini at the same time (1 = one after another)
+max_concurrent_prompts = 4
+
+# Upload the shared document context once per run via Gemini context caching
+use_context_cache = True
+
+# Stream responses and report partial output via global_signals.prompt_progress
+# (GUI_data["Stream Responses"] overrides)
+stream_responses = False
+
+# Reuse earlier responses for identical requests (see response_cache.py);
+# GUI_data["Response Cache"] overrides
+use_response_cache = False
+
+# Send each prompt only the documents listed in prompt_inputs instead of the full
+# context (GUI_data["Minimal Context"] overrides)
+use_minimal_context = True
+
+# Source documents each prompt uses (names as in the context). Prompts not listed
+# here get every document and keep using the cached full context.
+prompt_inputs = {
+    'prompt2_firstimpr': ["Assessment Notes.pdf"],
+    'prompt4_cogcap_scores': ["Cog. Test.pdf"],
+    'prompt4_cogcap_remarks': ["Cog. Test.pdf"],
+    'prompt5_language': ["Context and Task Description.docx", "Assessment Notes.pdf"],
+    'prompt7_qualscore': ["Assessment Notes.pdf"],
+    'prompt7_qualscore_data': ["Assessment Notes.pdf"],
+    'prompt8_datatools': ["Assessment Notes.pdf"],
+    'prompt9_interests': ["Assessment Notes.pdf"],
+}
+
+# Define which prompts should use thinking when enabled
+thinking_prompts = [
+    'prompt3_personality',
+    'prompt6a_conqual',
+    'prompt6b_conimprov',
+    'prompt7_qualscore',
+    'prompt7_qualscore_data'
+]
+
+# Define which prompts are expected to return lists (for parsing/evaluation)
+list_output_prompts = [
+    'prompt4_cogcap_scores', 'prompt5_language', 'prompt6a_conqual',
+    'prompt6b_conimprov', 'prompt7_qualscore', 'prompt7_qualscore_data',
+    'prompt8_datatools', 'prompt9_interests'
+]
+
+# Use Gemini's structured output (JSON following list_output_schemas) for the list
+# prompts instead of recovering the list from free text; GUI_data["Structured Output"] overrides
+use_structured_output = True
+
+_CEFR_LEVELS = ["A1", "A2", "B1", "B2", "C1", "C2", "N/A"]
+
+def _score_list_schema(length, nullable=False):
+    # Scores are -1, 0 or 1; null stands for "N/A"
+    item = {"type": "INTEGER", "minimum": -1, "maximum": 1}
+    if nullable:
+        item["nullable"] = True
+    return {"type": "ARRAY", "items": item, "min_items": length, "max_items": length}
+
+# Response schema per list prompt (google-genai Schema fields)
+list_output_schemas = {
+    'prompt4_cogcap_scores': {"type": "ARRAY", "items": {"type": "INTEGER", "minimum": 0, "maximum": 100},
+                              "min_items": 6, "max_items": 6},
+    'prompt5_language': {"type": "ARRAY", "items": {"type": "STRING", "enum": _CEFR_LEVELS},
+                         "min_items": 3, "max_items": 3},
+    'prompt6a_conqual': {"type": "ARRAY", "items": {"type": "STRING"}, "min_items": 1},
+    'prompt6b_conimprov': {"type": "ARRAY", "items": {"type": "STRING"}, "min_items": 1},
+    'prompt7_qualscore': _score_list_schema(20),
+    'prompt7_qualscore_data': _score_list_schema(23, nullable=True),
+    'prompt8_datatools': _score_list_schema(5, nullable=True),
+    'prompt9_interests': {"type": "ARRAY", "items": {"type": "STRING"}, "min_items": 1},
+}
+
+# Ask the short extraction prompts in one structured request (needs structured output);
+# fields that come back invalid are sent separately. GUI_data["Combined Extraction"] overrides
+use_combined_extraction = False
+
+# Prompts that can be answered together by the combined extraction
+combined_extraction_prompts = [
+    'prompt4_cogcap_scores', 'prompt5_language', 'prompt8_datatools', 'prompt9_interests'
+]
+
+def _combined_extraction_request(fields):
+    """Returns the prompt text and generation config asking for all fields in one JSON object."""
+    sections = "\n\n".join(f"### Field \"{prom}\"\n{prompts_with_temps[prom]['text'].strip()}" for prom in fields)
+    prompt_text = (
+        "Complete each of the following tasks. Answer with one JSON object that has one field per task, "
+        "named as in the task's heading, holding the list that task asks for. Output only the JSON object.\n\n"
+        + sections
+    )
+    generation_config = {
+        "temperature": min(prompts_with_temps[prom]['temperature'] for prom in fields),
+        "response_mime_type": "application/json",
+        "response_schema": {
+            "type": "OBJECT",
+            "properties": {prom: list_output_schemas[prom] for prom in fields},
+            "required": list(fields),
+        },
+    }
+    return prompt_text, generation_config
+
+def _parse_combined_extraction(output_text, fields):
+    """
+    Returns {prompt: JSON list string} for every valid field of a combined extraction response.
+
+    A field is valid if it is a non-empty list with the length its schema requires.
+    """
+    try:
+        answer = json.loads(output_text)
+    except (TypeError, ValueError):
+        print("Warning: Combined extraction response was not valid JSON.")
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+
+    extracted = {}
+    for prom in fields:
+        items = answer.get(prom)
+        schema = list_output_schemas[prom]
+        if not isinstance(items, list) or not items:
+            continue
+        if len(items) < schema.get("min_items", 1) or len(items) > schema.get("max_items", len(items)):
+            continue
+        extracted[prom] = json.dumps(["N/A" if item is None else item for item in items])
+    return extracted
+
+def _build_context(file_contents, file_names=None):
+    """Joins the documents (all, or only file_names) into the context string sent with the prompts."""
+    return "\n\n---\n\n".join([f"File: {file_name}\nContent:\n{content}"
+                                for file_name, content in file_contents.items()
+                                if file_names is None or file_name in file_names])
+
+def _context_files(prompts, file_contents):
+    """Returns the names of the documents the prompts use, or None if one of them needs all documents."""
+    names = set()
+    for prom in prompts:
+        if prom not in prompt_inputs:
+            return None
+        names.update(prompt_inputs[prom])
+    names &= set(file_contents)
+    # A subset that covers everything is the full context
+    return None if not names or names == set(file_contents) else names
+
+def _apply_icp_instruction(prom, prompt_text, icp_info, retry=False):
+    """Prepends the ICP specific instruction for this prompt (if any) with high emphasis."""
+    icp_instruction = icp_info.get(prom, "")
+    if not icp_instruction: # Only modify if specific info was provided
+        return prompt_text
+
+    title = "CRITICAL INSTRUCTION OVERRIDE FOR THIS TASK (RETRY ATTEMPT)          #" if retry \
+        else "CRITICAL INSTRUCTION OVERRIDE FOR THIS TASK                          #"
+    print(f"Applied CRITICAL ICP info to {'RETRY ' if retry else ''}prompt: {prom}")
+    return f"""\
+########################################################################
+# {title}
+########################################################################
+
+THE FOLLOWING INSTRUCTIONS ARE PARAMOUNT AND MUST BE FOLLOWED EXACTLY, SUPERSEDING ANY CONFLICTING GENERAL INSTRUCTIONS IN THE ORIGINAL PROMPT BELOW. FAILURE TO ADHERE STRICTLY WILL RESULT IN AN INCORRECT RESPONSE.
+
+Specific Instructions:
+{icp_instruction}
+
+########################################################################
+# END OF CRITICAL INSTRUCTIONS - NOW FOLLOW ORIGINAL PROMPT BELOW      #
+########################################################################
+
+--- Original Prompt ---
+{prompt_text}"""
+
+def _build_generation_config(prom, temperature, thinking_budget=None, structured_output=False):
+    """
+    Returns the generation config for a prompt, adding thinking when it has a thinking
+    budget and a JSON response schema for list prompts when structured output is enabled.
+    """
+    generation_config = {"temperature": temperature}
+    if thinking_budget:
+        generation_config["thinking_config"] = {"thinking_budget": thinking_budget}
+    if structured_output and prom in list_output_schemas:
+        generation_config["response_mime_type"] = "application/json"
+        generation_config["response_schema"] = list_output_schemas[prom]
+    return generation_config
+
+def _parse_list_result(output_text, structured=False):
+    """
+    Returns a list prompt's result as a JSON list string ('[]' if no list was found).
+
+    Structured (JSON) output is parsed directly, with null items turned into
+    "N/A" as the writers expect; anything else falls back to recovering the
+    list from free text with _extract_list_from_string.
+    """
+    if structured:
+        try:
+            items = json.loads(output_text)
+            if isinstance(items, list):
+                return json.dumps(["N/A" if item is None else item for item in items])
+        except ValueError:
+            print("Warning: Structured output was not valid JSON, recovering the list from text.")
+    return _extract_list_from_string(output_text)
+
+def _list_complete(text, structured):
+    """Returns True once streamed text contains the complete list."""
+    if structured:
+        try:
+            return isinstance(json.loads(text), list)
+        except ValueError:
+            return False
+    return _extract_list_from_string(text) != "[]"
+
+def _stream_prompt(client, model, prom, full_prompt, generation_config, span_attributes=None):
+    """
+    Streams one response from Gemini and returns its text.
+
+    The text received so far is emitted through global_signals.prompt_progress
+    after every chunk. For list prompts the stream is closed as soon as the
+    received text contains a complete list. The usage metadata of the last
+    chunk is recorded in span_attributes.
+    """
+    is_list = prom in list_output_prompts
+    structured = "response_schema" in generation_config
+    parts = []
+    stream = client.models.generate_content_stream(
+        model=model,
+        contents=full_prompt,
+        config=generation_config
+    )
+    try:
+        for chunk in stream:
+            if span_attributes is not None:
+                instrumentation.record_usage(chunk, span_attributes)
+            chunk_text = chunk.text or ""
+            if not chunk_text:
+                continue
+            parts.append(chunk_text)
+            output_text = "".join(parts)
+            global_signals.prompt_progress.emit(prom, output_text)
+            if is_list and "]" in chunk_text and _list_complete(output_text, structured):
+                break  # The list is complete, the rest of the response is not needed
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    return "".join(parts)
+
+def _request_prompt(client, prom, prepare, route, max_attempts,
+                    status_label, deadline=None, delay_first=False, stream=False, limiter=None):
+    """
+    Sends one prompt to Gemini, retrying on transient errors and empty results.
+
+    Waits between attempts follow retry_policy (exponential backoff with jitter,
+    honouring rate-limit delays). The first model of the route is used until it
+    fails with a permanent error or model_routing.fallback_after_errors
+    transient errors in a row; then the request moves on to the route's next
+    model. Permanent errors on the last model are not retried. With a limiter
+    (retry_policy.get_limiter) every request takes a token from it first. The
+    latency of every request is recorded in model_routing.route_stats.
+
+    Args:
+        prepare: Callable taking a model name and returning (full prompt,
+                 generation config, response cache key or None, cached response
+                 or None) for that model; the full prompt is None when a cached
+                 response was found
+        route: The prompt's route (model_routing.get_route)
+
+    Returns a (result, success) tuple. result is None when no attempt produced a
+    response at all; otherwise it is the parsed list string or the stripped text
+    of the last response received. With stream=True the response is streamed
+    (see _stream_prompt). A cached response found by prepare is returned without
+    calling Gemini, and with a cache key a successful result is stored in the
+    response cache.
+    """
+    models = route["models"]
+    prepared = {}  # model -> (full prompt, generation config, cache key, cached response)
+
+    def prepared_for(model):
+        if model not in prepared:
+            prepared[model] = prepare(model)
+        return prepared[model]
+
+    if prepared_for(models[0])[3] is not None:
+        print(f"Using cached response for prompt '{prom}'.")
+        return prepared_for(models[0])[3], True
+
+    policy = RetryPolicy(max_attempts=max_attempts)
+    is_list = prom in list_output_prompts
+    result = None
+    last_error = None
+    model_index = 0
+    model_errors = 0  # consecutive errors on the current model
+    for attempt in range(max_attempts):
+        model = models[model_index]
+        full_prompt, generation_config, cache_key, cached = prepared_for(model)
+        if cached is not None:
+            print(f"Using cached response of {model} for prompt '{prom}'.")
+            return cached, True
+        if deadline is not None and time.time() > deadline:
+            print(f"Timeout reached while retrying prompt '{prom}'.")
+            break
+        if attempt > 0 or delay_first:
+            wait = policy.delay(attempt if attempt > 0 else 1, last_error)
+            if deadline is not None and time.time() + wait > deadline:
+                print(f"Timeout reached while retrying prompt '{prom}'.")
+                break
+            global_signals.update_message.emit(f"Retrying {status_label} (attempt {attempt+1}/{max_attempts})...")
+            time.sleep(wait)
+        if limiter is not None and not limiter.acquire(deadline):
+            print(f"Timeout reached while waiting for the rate limit for prompt '{prom}'.")
+            break
+
+        start = time.perf_counter()
+        try:
+            with instrumentation.span("generate_content", prompt=prom, attempt=attempt + 1, model=model,
+                                      route=route["name"], stream=stream) as span_attributes:
+                if stream:
+                    output_text = _stream_prompt(client, model, prom, full_prompt, generation_config,
+                                                 span_attributes)
+                else:
+                    response = client.models.generate_content(
+                        model=model,
+                        contents=full_prompt,
+                        config=generation_config
+                    )
+                    instrumentation.record_usage(response, span_attributes)
+                    output_text = response.text or ""
+        except Exception as e:
+            model_routing.route_stats.record(route["name"], model, time.perf_counter() - start, False)
+            print(f"Error processing prompt {prom} with {model} (attempt {attempt+1}): {e}")
+            last_error = e
+            model_errors += 1
+            transient = policy.should_retry(e)
+            if (not transient or model_errors >= model_routing.fallback_after_errors) \
+                    and model_index + 1 < len(models):
+                model_index += 1
+                model_errors = 0
+                last_error = None  # A rate-limit delay of the old model does not apply to the new one
+                print(f"Falling back to {models[model_index]} for prompt '{prom}'.")
+                continue
+            if not transient:
+                print(f"Error for prompt '{prom}' is not transient, not retrying.")
+                break
+            continue
+        model_routing.route_stats.record(route["name"], model, time.perf_counter() - start, True)
+        last_error = None
+        model_errors = 0
+
+        # Check if we got a valid response
+        if is_list:
+            result = _parse_list_result(output_text, structured="response_schema" in generation_config)
+        else:
+            result = output_text.strip()
+        if result and result != "[]":
+            if cache_key is not None:
+                response_cache.put(cache_key, result)
+            return result, True
+        print(f"Warning: Empty {'list' if is_list else 'text'} result for prompt '{prom}' on attempt {attempt+1}.")
+
+    return result, False
+
+def send_prompts(data, workspace=None):
+    """
+    Sends all prompts for a candidate to Gemini and saves the results as JSON.
+
+    Args:
+        data: Dictionary with the candidate details, Gemini key and settings
+        workspace: The run's Workspace; its files (the redacted copies) are
+                   read and the results file gets a unique name in its output
+                   directory. Without one, data["Files"] and output_reports are used.
+
+    Returns:
+        Path to the saved results JSON file
+    """
     global_signals.update_message.emit("Connecting to Gemini...")
 
-    GOOGLE_API_KEY = data["Gemini Key"]
-    # Create client with API key
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-    
+    GOOGLE_API_KEY = data.get("Gemini Key", "")
+    # Create client with API key ("Model Backend": "fake" uses the offline stand-in, see model_client.py)
+    client = create_client(data.get("Model Backend"), GOOGLE_API_KEY, data.get("Fake Model Options"))
+
     # Get the thinking setting from GUI data
     enable_thinking = data.get("Enable Thinking", False)
-    # Define which prompts should use thinking when enabled
-    thinking_prompts = [
-        'prompt3_personality', 
-        'prompt6a_conqual', 
-        'prompt6b_conimprov', 
-        'prompt7_qualscore', 
-        'prompt7_qualscore_data'
-    ]
-    
+    # Number of prompts that may be in flight at once
+    concurrency = max(1, int(data.get("Max Concurrent Prompts", max_concurrent_prompts)))
+    # Request rate limit shared with the other runs in the process using the same rate
+    limiter = get_limiter(data.get("Requests Per Minute"))
+    # JSON output following a schema for the list prompts
+    structured_output = data.get("Structured Output", use_structured_output)
+    # Stream responses so partial output can be shown while a prompt runs
+    stream = data.get("Stream Responses", stream_responses)
+
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
     appl_name = data["Applicant Name"]
-    # Update to save to output_reports directory
-    output_dir = "output_reports"
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    # Set the file path to be in the output directory
-    filename_with_timestamp = os.path.join(output_dir, f"{appl_name}_{formatted_time}.json")
-
-    path_to_notes = r'temp/Assessment Notes.pdf'
-    path_to_persontest = r'temp/PAPI Gebruikersrapport.pdf'
-    path_to_cogcap = r'temp/Cog. Test.pdf'
+
+    # The redacted copies made by redact_folder
+    input_files = workspace.files if workspace is not None else data.get("Files", {})
+    path_to_notes = input_files.get("Assessment Notes", r'temp/Assessment Notes.pdf')
+    path_to_persontest = input_files.get("PAPI Gebruikersrapport", r'temp/PAPI Gebruikersrapport.pdf')
+    path_to_cogcap = input_files.get("Cog. Test", r'temp/Cog. Test.pdf')
     path_to_contextfile = r'resources/Context and Task Description.docx'
     path_to_toneofvoice = r'resources/Examples Personality Section.docx'
     path_to_mcpprofile = r'resources/The MCP Profile.docx'
     path_to_dataprofile = r'resources/The Data Chiefs profile.docx'
 
+    # Text redact_folder already extracted from the redacted PDFs with PyMuPDF (path -> text);
+    # with another backend, or for long PDFs, it leaves none and read_pdf reads the redacted copy
+    extracted_texts = workspace.texts if workspace is not None else {}
+    pre_extracted = {input_files[key]: text for key, text in extracted_texts.items() if key in input_files}
+
     lst_files = [
         path_to_notes,
         path_to_persontest,
@@ -461,11 +851,22 @@ def send_prompts(data):
     else: # Handles MCP, NEW, and any potential unknown as MCP
         lst_files.append(path_to_mcpprofile)
 
+    # The prompts refer to the candidate files by their standard names, whatever the copies are called
+    file_labels = {
+        path_to_notes: "Assessment Notes.pdf",
+        path_to_persontest: "PAPI Gebruikersrapport.pdf",
+        path_to_cogcap: "Cog. Test.pdf",
+    }
+
+    pdf_backend = data.get("PDF Backend")  # None uses pdf_text.default_backend
+
     file_contents = {}
     for file_path in lst_files:
-        file_name = os.path.basename(file_path)
-        if file_path.endswith('.pdf'):
-            file_contents[file_name] = read_pdf(file_path)
+        file_name = file_labels.get(file_path, os.path.basename(file_path))
+        if file_path in pre_extracted:
+            file_contents[file_name] = pre_extracted[file_path]
+        elif file_path.endswith('.pdf'):
+            file_contents[file_name] = read_pdf(file_path, pdf_backend)
         elif file_path.endswith('.docx'):
             file_contents[file_name] = read_docx(file_path)
         else:
@@ -475,7 +876,7 @@ def send_prompts(data):
     # --- Read ICP Description File (if applicable) --- Append to file_contents
     icp_description_content = ""
     if selected_program == 'ICP':
-        icp_file_path = data.get("Files", {}).get("ICP Description") # Safer get
+        icp_file_path = input_files.get("ICP Description") # Safer get
         if icp_file_path and os.path.exists(icp_file_path):
             try:
                 icp_description_content = read_docx(icp_file_path)
@@ -488,10 +889,14 @@ def send_prompts(data):
             print(f"Warning: ICP Description file path not found or file missing: {icp_file_path}")
             # Don't add to file_contents if missing
 
-    # --- Get ICP Specific Prompt Info --- (Store them for use in the loop)
-    icp_info_p3 = data.get("ICP_Info_Prompt3", "") if selected_program == 'ICP' else ""
-    icp_info_p6a = data.get("ICP_Info_Prompt6a", "") if selected_program == 'ICP' else ""
-    icp_info_p6b = data.get("ICP_Info_Prompt6b", "") if selected_program == 'ICP' else ""
+    # --- Get ICP Specific Prompt Info --- (Store them for use by every request)
+    icp_info = {}
+    if selected_program == 'ICP':
+        icp_info = {
+            'prompt3_personality': data.get("ICP_Info_Prompt3", ""),
+            'prompt6a_conqual': data.get("ICP_Info_Prompt6a", ""),
+            'prompt6b_conimprov': data.get("ICP_Info_Prompt6b", ""),
+        }
 
     global_signals.update_message.emit("Files uploaded, starting prompts...")
 
@@ -504,13 +909,6 @@ def send_prompts(data):
     lst_prompts_mcp = common_prompts + ['prompt7_qualscore']
     lst_prompts_data = common_prompts + ['prompt7_qualscore_data', 'prompt8_datatools']
 
-    # Define which prompts are expected to return lists (for parsing/evaluation)
-    list_output_prompts = [
-        'prompt4_cogcap_scores', 'prompt5_language', 'prompt6a_conqual',
-        'prompt6b_conimprov', 'prompt7_qualscore', 'prompt7_qualscore_data',
-        'prompt8_datatools', 'prompt9_interests'
-    ]
-
     # --- Select appropriate list of prompts ---
     # Use MCP prompts for both MCP and NEW programs
     if selected_program == 'DATA':
@@ -518,228 +916,228 @@ def send_prompts(data):
     else: # Handles MCP, NEW, and any potential unknown as MCP
         lst_prompts = lst_prompts_mcp
 
-    # --- Run Prompts --- 
-    results = {}
+    # Count the documents and trim those over their token budget before anything is sent
+    token_counter = token_budget.TokenCounter(client, default_model)
+    with instrumentation.span("token_preflight") as span_attributes:
+        file_contents, document_tokens = token_budget.apply_budgets(
+            file_contents, token_counter,
+            total_budget=data.get("Context Token Budget", token_budget.context_token_budget))
+        span_attributes["context_tokens"] = sum(document_tokens.values())
+
+    # --- Run Prompts ---
     start_time_all = time.time()
 
     # Build the general context string ONCE (includes ICP description if present)
-    general_context = "\n\n---\n\n".join([f"File: {file_name}\nContent:\n{content}"
-                                     for file_name, content in file_contents.items()])
-
-    for promno, prom in enumerate(lst_prompts, start=1):
-        global_signals.update_message.emit(f"Submitting prompt {promno}/{len(lst_prompts)}, please wait...")
-
+    general_context = _build_context(file_contents)
+
+    # Upload the general context once and let every prompt reference it (falls back to inline context)
+    context_cache = None
+    if data.get("Context Caching", use_context_cache):
+        context_cache = ContextCache(client, general_context,
+                                     ttl_seconds=data.get("Context Cache TTL", default_cache_ttl),
+                                     display_name=f"ART context {formatted_time}")
+
+    # Identical requests on the same documents can reuse earlier responses
+    use_cache = data.get("Response Cache", use_response_cache)
+    context_digest = response_cache.context_hash(general_context) if use_cache else None
+
+    # Prompts that declare their inputs get a context with only those documents
+    minimal_context = data.get("Minimal Context", use_minimal_context)
+    general_context_tokens = token_counter.count(general_context)
+    reduced_contexts = {}  # document names -> (context, digest)
+    context_savings = []  # estimated input tokens saved per request with a reduced context
+
+    def select_context(prompts):
+        """Returns (context, response cache digest, is full context) for the prompts."""
+        file_names = _context_files(prompts, file_contents) if minimal_context else None
+        if file_names is None:
+            return general_context, context_digest, True
+        key = tuple(sorted(file_names))
+        if key not in reduced_contexts:
+            context = _build_context(file_contents, file_names)
+            reduced_contexts[key] = (context, response_cache.context_hash(context) if use_cache else None)
+        context, digest = reduced_contexts[key]
+        return context, digest, False
+
+    def attach_context(prompt_text, generation_config, prompts, model):
+        """
+        Returns (full prompt, generation config, response cache key, cached response) for a request.
+
+        The full prompt holds the instructions and the context of the prompts. The response
+        cache is looked up once, here; on a hit the full prompt is None and the cached response
+        is returned instead, so the context is neither assembled nor uploaded.
+        """
+        context, digest, full_context = select_context(prompts)
+        generation_config = dict(generation_config)  # Each model gets its own (cached content differs)
+        cache_key = None
+        if use_cache:
+            cache_key = response_cache.make_key(model, prompt_text, generation_config['temperature'],
+                                                generation_config.get("thinking_config"), digest)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return None, generation_config, cache_key, cached
+        cache_name = context_cache.get(model) if context_cache and full_context else None
+        context_tokens = token_counter.count(context)
+        if cache_name:
+            # The files live in the cached content, only the instructions are sent
+            generation_config["cached_content"] = cache_name
+            full_prompt = f"{prompt_text}\n\nUse the files provided in the cached context to complete the tasks."
+            print(f"Prompt tokens for {', '.join(prompts)} ({model}): {token_counter.count(full_prompt)} "
+                  f"+ {context_tokens} from the cached context")
+        else:
+            # Construct the full prompt using the (reduced) context
+            full_prompt = f"{prompt_text}\n\nUse the following files to complete the tasks. Do not give any output for this prompt.\n{context}"
+            print(f"Prompt tokens for {', '.join(prompts)} ({model}): {token_counter.count(prompt_text) + context_tokens} "
+                  f"({context_tokens} context)")
+            if not full_context:
+                context_savings.append(general_context_tokens - context_tokens)
+        return full_prompt, generation_config, cache_key, None
+
+    def get_route(prom):
+        """Returns the model route of a prompt for this program."""
+        return model_routing.get_route(prom, selected_program,
+                                       model_routing.default_thinking_budget if prom in thinking_prompts else None)
+
+    def build_prompt(prom, model, retry=False):
+        """Returns attach_context's (full prompt, generation config, cache key, cached response) for a single prompt."""
         prompt_data = prompts_with_temps[prom]
-        prompt_text = prompt_data['text']
-        temperature = prompt_data['temperature']
-        
-        # --- Inject SPECIFIC ICP Info with HIGH EMPHASIS ---
-        final_prompt_text = prompt_text
-        icp_instruction = ""
-
-        if selected_program == 'ICP':
-            if prom == 'prompt3_personality' and icp_info_p3:
-                icp_instruction = icp_info_p3
-            elif prom == 'prompt6a_conqual' and icp_info_p6a:
-                icp_instruction = icp_info_p6a
-            elif prom == 'prompt6b_conimprov' and icp_info_p6b:
-                icp_instruction = icp_info_p6b
-
-            if icp_instruction: # Only modify if specific info was provided
-                final_prompt_text = f"""\
-########################################################################
-# CRITICAL INSTRUCTION OVERRIDE FOR THIS TASK                          #
-########################################################################
-
-THE FOLLOWING INSTRUCTIONS ARE PARAMOUNT AND MUST BE FOLLOWED EXACTLY, SUPERSEDING ANY CONFLICTING GENERAL INSTRUCTIONS IN THE ORIGINAL PROMPT BELOW. FAILURE TO ADHERE STRICTLY WILL RESULT IN AN INCORRECT RESPONSE.
+        final_prompt_text = _apply_icp_instruction(prom, prompt_data['text'], icp_info, retry=retry)
+        budget = model_routing.thinking_budget(get_route(prom), model) if enable_thinking else None
+        generation_config = _build_generation_config(prom, prompt_data['temperature'], budget,
+                                                     structured_output)
+        return attach_context(final_prompt_text, generation_config, [prom], model)
 
-Specific Instructions:
-{icp_instruction}
+    completed = []  # Shared counter for progress messages across worker threads
 
-########################################################################
-# END OF CRITICAL INSTRUCTIONS - NOW FOLLOW ORIGINAL PROMPT BELOW      #
-########################################################################
-
---- Original Prompt ---
-{prompt_text}"""
-                print(f"Applied CRITICAL ICP info to prompt: {prom}")
+    def run_prompt(promno, prom):
+        """Runs a single prompt with its retries. Returns None if the time budget ran out before it started."""
+        if time.time() - start_time_all > max_wait_time:
+            print(f"Timeout for all prompts reached, skipping prompt '{prom}'.")
+            return None
 
-        # Prepare generation config with temperature
-        generation_config = {"temperature": temperature}
-        
-        # Add thinking configuration if enabled and this prompt should use thinking
-        if enable_thinking and prom in thinking_prompts:
-            # Use the thinking_config parameter when enabled
-            generation_config = {
-                "temperature": temperature,
-                "thinking_config": {
-                    "thinking_budget": 8096
-                }
-            }
+        global_signals.update_message.emit(f"Submitting prompt {promno}/{len(lst_prompts)}, please wait...")
+        route = get_route(prom)
+        if enable_thinking and model_routing.thinking_budget(route, route["models"][0]):
             global_signals.update_message.emit(f"Using AI thinking for prompt {promno} ({prom})...")
-        
-        # Construct the full prompt using the general context
-        full_prompt = f"{final_prompt_text}\n\nUse the following files to complete the tasks. Do not give any output for this prompt.\n{general_context}"
 
-        # Initial attempt
         max_attempts = 3  # Maximum number of attempts per prompt
-        attempt = 0
-        success = False
-        
-        while attempt < max_attempts and not success:
-            try:
-                if attempt > 0:
-                    global_signals.update_message.emit(f"Retrying prompt {promno}/{len(lst_prompts)} (attempt {attempt+1}/{max_attempts})...")
-                    # Add a short delay between retry attempts to avoid hammering the API
-                    time.sleep(1)
-                    
-                response = client.models.generate_content(
-                    model=default_model,
-                    contents=full_prompt,
-                    config=generation_config
-                )
-                output_text = response.text
-
-                # Check if we got a valid response
-                if prom in list_output_prompts:
-                    result = _extract_list_from_string(output_text)
-                    if result != "[]" and result.strip():
-                        results[prom] = result
-                        success = True
-                    else:
-                        print(f"Warning: Empty list result for prompt '{prom}' on attempt {attempt+1}.")
-                else:
-                    if output_text.strip():
-                        results[prom] = output_text.strip()
-                        success = True
-                    else:
-                        print(f"Warning: Empty text result for prompt '{prom}' on attempt {attempt+1}.")
-                
-                # If this is the last attempt and we haven't succeeded, use whatever we got
-                if not success and attempt == max_attempts - 1:
-                    if prom in list_output_prompts:
-                        results[prom] = _extract_list_from_string(output_text)
-                    else:
-                        results[prom] = output_text.strip()
-                    print(f"Warning: Using potentially empty result for '{prom}' after {max_attempts} attempts.")
-
-            except Exception as e:
-                print(f"Error processing prompt {prom} (attempt {attempt+1}): {e}")
-                if attempt == max_attempts - 1:  # Last attempt
-                    results[prom] = "[]" if prom in list_output_prompts else ""  # Ensure empty result matches type
-            
-            attempt += 1
-
+        result, success = _request_prompt(client, prom, lambda model: build_prompt(prom, model), route,
+                                          max_attempts, f"prompt {promno}/{len(lst_prompts)}", stream=stream,
+                                          limiter=limiter)
+        if not success:
+            # Use whatever we got, making sure an empty result matches the expected type
+            if result is None:
+                result = "[]" if prom in list_output_prompts else ""
+            print(f"Warning: Using potentially empty result for '{prom}' after {max_attempts} attempts.")
+
+        completed.append(prom)
+        global_signals.update_message.emit(f"Finished {len(completed)}/{len(lst_prompts)} prompts...")
+        return result
+
+    def run_combined(fields):
+        """Runs the combined extraction. Returns the valid fields as {prompt: result}."""
         if time.time() - start_time_all > max_wait_time:
-            print("Timeout for all prompts reached.")
-            break
+            print("Timeout for all prompts reached, skipping the combined extraction.")
+            return {}
+
+        global_signals.update_message.emit(f"Submitting combined extraction ({len(fields)} prompts), please wait...")
+        prompt_text, generation_config = _combined_extraction_request(fields)
+        output_text, success = _request_prompt(
+            client, "combined_extraction",
+            lambda model: attach_context(prompt_text, generation_config, fields, model),
+            get_route("combined_extraction"), 2, "combined extraction", limiter=limiter)
+        extracted = _parse_combined_extraction(output_text, fields) if success else {}
+
+        completed.extend(extracted)
+        global_signals.update_message.emit(f"Finished {len(completed)}/{len(lst_prompts)} prompts...")
+        return extracted
+
+    # Short extraction prompts answered together in one structured request
+    combined_fields = []
+    if data.get("Combined Extraction", use_combined_extraction) and structured_output:
+        combined_fields = [prom for prom in combined_extraction_prompts if prom in lst_prompts]
+        if len(combined_fields) < 2:
+            combined_fields = []
 
-    # --- Retry Logic for Critical Prompts ---
-    # This provides additional retries for specific critical prompts
-    critical_prompts = ['prompt6b_conimprov']
-    # Use MCP critical prompt for both MCP and NEW
-    if selected_program == 'DATA':
-        critical_prompts.append('prompt7_qualscore_data')
-    else: # Handles MCP, NEW, and any potential unknown as MCP
-        critical_prompts.append('prompt7_qualscore')
-        
-    max_retries = 2
-    for prom in critical_prompts:
-        if prom not in results or results[prom] == "" or results[prom] == "[]":
-            print(f"Warning: Result for critical prompt '{prom}' is still empty after initial attempts. Retrying...")
-            for attempt in range(max_retries):
-                if time.time() - start_time_all > max_wait_time:
-                    print("Timeout reached during critical prompt retry.")
-                    break # Break retry loop if overall timeout hit
-                    
-                global_signals.update_message.emit(f"Retrying critical prompt '{prom}' (Extra attempt {attempt + 1}/{max_retries})...")
-                
-                # Add a short delay between retry attempts to avoid hammering the API
-                time.sleep(1)
-                
-                # Reuse prompt details from initial run
-                prompt_data = prompts_with_temps[prom]
-                prompt_text = prompt_data['text']
-                temperature = prompt_data['temperature']
-                
-                # --- Inject SPECIFIC ICP Info for RETRY with HIGH EMPHASIS ---
-                final_prompt_text_retry = prompt_text
-                icp_instruction_retry = "" # Reset for retry
-
-                if selected_program == 'ICP':
-                    # Check which specific prompt it is and get the corresponding info
-                    if prom == 'prompt3_personality' and icp_info_p3: # Use stored info
-                        icp_instruction_retry = icp_info_p3
-                    elif prom == 'prompt6a_conqual' and icp_info_p6a: # Use stored info
-                        icp_instruction_retry = icp_info_p6a
-                    elif prom == 'prompt6b_conimprov' and icp_info_p6b: # Use stored info
-                        icp_instruction_retry = icp_info_p6b
-
-                    if icp_instruction_retry: # Only modify if specific info was provided
-                        final_prompt_text_retry = f"""\
-########################################################################
-# CRITICAL INSTRUCTION OVERRIDE FOR THIS TASK (RETRY ATTEMPT)          #
-########################################################################
-
-THE FOLLOWING INSTRUCTIONS ARE PARAMOUNT AND MUST BE FOLLOWED EXACTLY, SUPERSEDING ANY CONFLICTING GENERAL INSTRUCTIONS IN THE ORIGINAL PROMPT BELOW. FAILURE TO ADHERE STRICTLY WILL RESULT IN AN INCORRECT RESPONSE.
-
-Specific Instructions:
-{icp_instruction_retry}
-
-########################################################################
-# END OF CRITICAL INSTRUCTIONS - NOW FOLLOW ORIGINAL PROMPT BELOW      #
-########################################################################
-
---- Original Prompt ---
-{prompt_text}"""
-                        print(f"Applied CRITICAL ICP info to RETRY prompt: {prom}")
-
-                # Prepare generation config with temperature
-                generation_config = {"temperature": temperature}
-                
-                # Add thinking configuration if enabled and this prompt should use thinking
-                if enable_thinking and prom in thinking_prompts:
-                    # Use the thinking_config parameter when enabled
-                    generation_config = {
-                        "temperature": temperature,
-                        "thinking_config": {
-                            "thinking_budget": 8096
-                        }
-                    }
-                    global_signals.update_message.emit(f"Using AI thinking for prompt {promno} ({prom})...")
-                
-                # Use general_context built earlier
-                full_prompt_retry = f"{final_prompt_text_retry}\n\nUse the following files to complete the tasks. Do not give any output for this prompt.\n{general_context}"
-                
+    try:
+        # The prompts don't depend on each other, so they are sent concurrently
+        # (bounded by `concurrency`). Results are collected in prompt order so the
+        # results dict stays the same regardless of completion order.
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            combined_future = executor.submit(instrumentation.bind(run_combined), combined_fields) \
+                if combined_fields else None
+            futures = {prom: executor.submit(instrumentation.bind(run_prompt), promno, prom)
+                       for promno, prom in enumerate(lst_prompts, start=1) if prom not in combined_fields}
+
+            combined_results = {}
+            if combined_future is not None:
                 try:
-                    response = client.models.generate_content(
-                        model=default_model,
-                        contents=full_prompt_retry,
-                        config=generation_config
-                    )
-                    output_text_retry = response.text
-
-                    if prom in list_output_prompts:
-                        results[prom] = _extract_list_from_string(output_text_retry)
-                    else:
-                        results[prom] = output_text_retry.strip()
-
-                    # Check if retry was successful
-                    if results[prom] != "" and results[prom] != "[]":
-                        print(f"Success: Extra retry for '{prom}' successful on attempt {attempt + 1}.")
-                        break # Exit retry loop
-                    else:
-                         print(f"Warning: Extra retry attempt {attempt + 1} for '{prom}' still resulted in empty response.")
-
+                    combined_results = combined_future.result()
                 except Exception as e:
-                    print(f"Error processing extra retry for prompt {prom} (Attempt {attempt + 1}): {e}")
-                    # Don't update results[prom] here as we want to keep the best result so far
-
-            # After all retries, check final result
-            if prom in results and (results[prom] == "" or results[prom] == "[]"):
-                print(f"Error: Critical prompt '{prom}' still empty after all attempts.")
-                
-    # --- End Retry Logic ---
+                    print(f"Error processing the combined extraction: {e}")
+                # Fields that came back missing or invalid are asked separately
+                for promno, prom in enumerate(lst_prompts, start=1):
+                    if prom in combined_fields and prom not in combined_results:
+                        print(f"Warning: Combined extraction gave no valid '{prom}', sending it separately.")
+                        futures[prom] = executor.submit(instrumentation.bind(run_prompt), promno, prom)
+
+            results = {}
+            for prom in lst_prompts:
+                if prom in combined_results:
+                    results[prom] = combined_results[prom]
+                    continue
+                try:
+                    result = futures[prom].result()
+                except Exception as e:
+                    print(f"Error processing prompt {prom}: {e}")
+                    result = "[]" if prom in list_output_prompts else ""
+                if result is not None:
+                    results[prom] = result
+
+        # --- Retry Logic for Critical Prompts ---
+        # This provides additional retries for specific critical prompts
+        critical_prompts = ['prompt6b_conimprov']
+        # Use MCP critical prompt for both MCP and NEW
+        if selected_program == 'DATA':
+            critical_prompts.append('prompt7_qualscore_data')
+        else: # Handles MCP, NEW, and any potential unknown as MCP
+            critical_prompts.append('prompt7_qualscore')
+
+        max_retries = 2
+        for prom in critical_prompts:
+            if prom not in results or results[prom] == "" or results[prom] == "[]":
+                print(f"Warning: Result for critical prompt '{prom}' is still empty after initial attempts. Retrying...")
+                result, success = _request_prompt(client, prom,
+                                                  lambda model: build_prompt(prom, model, retry=True),
+                                                  get_route(prom), max_retries, f"critical prompt '{prom}'",
+                                                  deadline=start_time_all + max_wait_time, delay_first=True,
+                                                  stream=stream, limiter=limiter)
+                # Keep the best result so far if no extra attempt produced a response
+                if result is not None:
+                    results[prom] = result
+                if success:
+                    print(f"Success: Extra retry for '{prom}' successful.")
+
+                # After all retries, check final result
+                if prom in results and (results[prom] == "" or results[prom] == "[]"):
+                    print(f"Error: Critical prompt '{prom}' still empty after all attempts.")
+
+        # --- End Retry Logic ---
+
+        if context_savings:
+            saved_tokens = sum(context_savings)
+            print(f"Reduced context: {len(context_savings)} requests sent only their own documents, "
+                  f"saving about {saved_tokens} input tokens "
+                  f"({saved_tokens / max(1, general_context_tokens * len(context_savings)):.0%} of their context).")
+            instrumentation.add_span("reduced_context", 0.0, requests=len(context_savings),
+                                     context_tokens_saved=saved_tokens)
+
+        print("Model latency per route (this session):")
+        model_routing.route_stats.report()
+    finally:
+        # Remove the cached context (it would otherwise live until its TTL expires)
+        if context_cache:
+            context_cache.cleanup()
 
     def process_prompt_results(results):
         """Process the results from the prompts to ensure proper formatting."""
@@ -849,10 +1247,33 @@ Specific Instructions:
 
         return results
 
-    results = process_prompt_results(results)
+    with instrumentation.span("process_prompt_results"):
+        results = process_prompt_results(results)
+
+    # Candidate details, so the report can be re-rendered from this file alone
+    results["_candidate"] = {key: data.get(key, "") for key in CANDIDATE_KEYS}
+
+    if workspace is not None:
+        # Reserve a unique results file so concurrent runs never overwrite each other. Reserved only
+        # now, so a run that fails earlier leaves no empty results file behind
+        filename_with_timestamp = workspace.reserve_output_path(f"{appl_name}_{formatted_time}.json")
+    else:
+        # Update to save to output_reports directory
+        output_dir = "output_reports"
+        # Create the output directory if it doesn't exist
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        # Set the file path to be in the output directory
+        filename_with_timestamp = os.path.join(output_dir, f"{appl_name}_{formatted_time}.json")
 
-    with open(filename_with_timestamp, 'w') as json_file:
-        json.dump(results, json_file, indent=4)
+    try:
+        with open(filename_with_timestamp, 'w') as json_file:
+            json.dump(results, json_file, indent=4)
+    except Exception:
+        # Never leave an empty or partial results file for render-only mode to pick up
+        if workspace is not None:
+            workspace.release_output_path(filename_with_timestamp)
+        raise
 
     global_signals.update_message.emit("Prompting finished, generating report...")
     return filename_with_timestamp
\ No newline at end of file
@@ -1,15 +1,45 @@
+import atexit
+import bisect
 import fitz
 import re
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdf_text
+
+# Name particles that are never redacted on their own (e.g. "van" in "Piet van Dam")
+NAME_PARTICLES = {"van", "de", "der", "den", "het", "ten", "ter", "te", "op", "in", "la", "le", "von", "du", "da", "di"}
+
+# Name parts shorter than this are only redacted as part of the full name
+MIN_NAME_PART_LENGTH = 3
+
+# Share of a match's height left out at its top and bottom when redacting. Text boxes of
+# adjacent lines overlap, and every character touching a redaction is removed
+REDACT_VERTICAL_INSET = 0.25
+
+# Endings a name may carry and still be redacted (possessives such as "Jansens" or "Piet's")
+NAME_SUFFIX = r"(?:['’]?s)?"
 
 class Redactor:
+    EMAIL_REG = r'[\w\.-]+@[\w\.-]+'
+    PHONE_REG = r'\+\d{1,3}\s*\d{1,3}(\s*\d{2,3}){2,4}'
+
+    @staticmethod
+    def name_regex(target_names):
+        """Returns a regex matching any of the names (with NAME_SUFFIX), longest first so full names win over their parts."""
+        names = sorted(set(target_names), key=len, reverse=True)
+        return r'\b(' + '|'.join(re.escape(name) for name in names) + r')' + NAME_SUFFIX + r'\b'
+
     @staticmethod
     def get_sensitive_data(lines, target_names):
         """ Function to get sensitive data lines containing specified keywords and other sensitive information """
-        NAME_REG = r'\b(' + '|'.join(re.escape(name) for name in target_names) + r')\b'
-        EMAIL_REG = r'[\w\.-]+@[\w\.-]+'
-        PHONE_REG = r'\+\d{1,3}\s*\d{1,3}(\s*\d{2,3}){2,4}'
+        NAME_REG = Redactor.name_regex(target_names)
+        EMAIL_REG = Redactor.EMAIL_REG
+        PHONE_REG = Redactor.PHONE_REG
         
         keywords = ["gender", "address", "phone", "e-mail", "date of birth", "links", "socials"]
 
@@ -37,6 +67,77 @@ class Redactor:
         self.target_names = [name for name in target_names if name] # Ensure list and remove empty strings
         print(f"Redactor initialized to target: {self.target_names}") # Debug print
 
+        # Full names in any case, plus their distinctive parts (first name, surname) only when
+        # capitalised or in capitals, so a candidate called Will or Hope does not black out
+        # every "will" or "hope"
+        name_parts = []
+        for name in self.target_names:
+            for part in name.split():
+                if len(part) >= MIN_NAME_PART_LENGTH and part.lower() not in NAME_PARTICLES:
+                    name_parts += [part[:1].upper() + part[1:], part.upper()]
+        self.patterns = [
+            re.compile(self.EMAIL_REG),
+            re.compile(self.PHONE_REG),
+        ]
+        if name_parts:
+            self.patterns.insert(0, re.compile(self.name_regex(name_parts)))
+        if self.target_names:
+            self.patterns.insert(0, re.compile(self.name_regex(self.target_names), re.IGNORECASE))
+
+    def _redact_page(self, page):
+        """
+        Marks and applies the redactions of one page. Returns the number of redactions.
+
+        The page's words (with positions) are extracted once; names, name
+        parts, e-mail addresses and phone numbers are matched per text line.
+        Only the matched text is redacted: it is located within the words the
+        match touches, so neighbouring characters stay readable.
+        """
+        lines = {}
+        for word in page.get_text("words"):
+            # word = (x0, y0, x1, y1, text, block_no, line_no, word_no)
+            lines.setdefault((word[5], word[6]), []).append(word)
+
+        changes = 0
+        redacted = []  # areas already marked, so a part inside a full name is not marked twice
+        for line_words in lines.values():
+            starts = []
+            offset = 0
+            for word in line_words:
+                starts.append(offset)
+                offset += len(word[4]) + 1
+            line_text = " ".join(word[4] for word in line_words)
+
+            for pattern in self.patterns:
+                for match in pattern.finditer(line_text):
+                    first = bisect.bisect_right(starts, match.start()) - 1
+                    last = bisect.bisect_left(starts, match.end()) - 1
+                    area = fitz.Rect(line_words[first][:4])
+                    for word in line_words[first + 1:last + 1]:
+                        area |= fitz.Rect(word[:4])
+                    # The exact position of the matched text within those words
+                    quads = page.search_for(match.group(0), clip=area, quads=True) or [area.quad]
+                    quads = [quad for quad in quads if not any(quad.rect in done for done in redacted)]
+                    if not quads:
+                        continue
+                    changes += 1
+                    for quad in quads:
+                        redacted.append(quad.rect)
+                        inset = quad.rect.height * REDACT_VERTICAL_INSET
+                        rect = fitz.Rect(quad.rect.x0, quad.rect.y0 + inset, quad.rect.x1, quad.rect.y1 - inset)
+                        # Create a solid black rectangle for redaction
+                        # Set text color to white (invisible against black) and fill color to black
+                        annot = page.add_redact_annot(rect, text=" ", fill=(0, 0, 0), text_color=(1, 1, 1))
+                        # Ensure we have proper settings for solid appearance
+                        annot.set_border(width=0)  # No border
+                        annot.set_opacity(1.0)     # Fully opaque
+
+        if changes:
+            print(f"  Found {changes} sensitive items on page {page.number}")
+            # Apply the redactions for the current page
+            page.apply_redactions()
+        return changes
+
     def redaction(self, filename):
         """Performs redaction on the given PDF filename."""
         if not self.target_names:
@@ -48,27 +149,10 @@ class Redactor:
             doc = fitz.open(filename)
             changes = 0
             for page in doc:
-                for name_to_redact in self.target_names:
-                     # Split name into parts if needed (e.g., "First Last")
-                     name_parts = name_to_redact.split()
-                     # --- Redact full name ---
-                     sensitive_areas = page.search_for(name_to_redact, quads=True)
-                     if sensitive_areas:
-                        print(f"  Found '{name_to_redact}' {len(sensitive_areas)} times on page {page.number}")
-                        changes += len(sensitive_areas)
-                        for quad in sensitive_areas:
-                            # Create a solid black rectangle for redaction
-                            # Set text color to white (invisible against black) and fill color to black
-                            annot = page.add_redact_annot(quad, text=" ", fill=(0, 0, 0), text_color=(1, 1, 1))
-                            # Ensure we have proper settings for solid appearance
-                            annot.set_border(width=0)  # No border
-                            annot.set_opacity(1.0)     # Fully opaque
-
-                # Apply the redactions for the current page
-                page.apply_redactions()
+                changes += self._redact_page(page)
 
             if changes > 0:
-                # Save the redacted file, overwriting the original in the temp folder
+                # Save the redacted file, overwriting the copy in the workspace
                 doc.save(filename, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
                 print(f"  Applied {changes} redactions to {filename}")
             else:
@@ -85,16 +169,128 @@ class Redactor:
                 except: # Handle cases where doc might be invalid
                     pass
 
-def create_temp_folder():
-    temp_folder = 'temp'
-    if not os.path.exists(temp_folder):
-        os.makedirs(temp_folder)
-            
-def redact_folder(GUI_data):
-    """Redacts specified names in the specific PDF files provided via GUI_data."""
+    def redact_and_extract(self, filename, save_to=None, backend=None, save_always=True):
+        """
+        Redacts a PDF in memory and returns the text of the redacted pages.
+
+        The PDF is opened once; the original file is never modified. With the
+        PyMuPDF backend the text of a PDF shorter than
+        pdf_text.parallel_page_threshold is taken in the same pass. Otherwise
+        (another backend, or a PDF long enough for parallel extraction) the
+        redacted PDF is written to save_to and None is returned; its text is
+        then read from that copy with prompting.read_pdf.
+
+        Args:
+            filename: Path of the PDF to redact
+            save_to: Path to save the redacted PDF to
+            backend: PDF text backend (default: pdf_text.default_backend)
+            save_always: If False, save_to is only written when the text is not returned
+
+        Returns:
+            The redacted text, each page followed by a newline, or None (raises on errors)
+        """
+        backend = backend or pdf_text.default_backend
+        print(f"Starting redaction for: {filename}") # Debug print
+        with fitz.open(filename) as doc:
+            extract_here = backend == "pymupdf" and doc.page_count < pdf_text.parallel_page_threshold
+            if not extract_here and not save_to:
+                raise ValueError(f"Extracting {filename} with '{backend}' needs a path to save the redacted PDF to")
+            changes = 0
+            pages = []
+            for page in doc:
+                changes += self._redact_page(page)
+                if extract_here:
+                    pages.append(page.get_text())
+
+            if save_to and (save_always or not extract_here):
+                doc.save(save_to, garbage=1, deflate=True)
+            print(f"  Applied {changes} redactions to {filename}" if changes else f"  No target names found in {filename}")
+
+        if not extract_here:
+            return None
+        return "\n".join(pages) + "\n" if pages else ""
+
+# Whether redact_folder also writes the redacted PDFs to the workspace
+# (the prompting stage only needs the redacted text); GUI_data["Save Redacted PDFs"] overrides
+save_redacted_pdfs = False
+
+# Number of worker processes that redact PDFs in parallel (shared by all runs in the process)
+redaction_workers = min(4, os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
 
-    # Make sure temp folder exists
-    create_temp_folder()
+def _get_pool():
+    """Returns the shared redaction process pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, redaction_workers))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def _reset_pool():
+    """Drops a broken pool so the next run starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+def _redact_file(target_names, file_path, save_to, save_always, backend):
+    """
+    Worker task: redacts one PDF and returns (redacted text or None, seconds taken).
+
+    Runs in a pool process, so the Redactor is created there.
+    """
+    start = time.time()
+    text = Redactor(target_names).redact_and_extract(file_path, save_to=save_to, backend=backend,
+                                                     save_always=save_always)
+    return text, time.time() - start
+
+def _workspace_file_name(file_key, file_path):
+    """Returns the standard name of an input file inside the workspace."""
+    # Use standard names expected by send_prompts
+    if file_key == "PAPI Gebruikersrapport":
+        return "PAPI Gebruikersrapport.pdf"
+    elif file_key == "Cog. Test":
+        return "Cog. Test.pdf"
+    elif file_key == "Assessment Notes":
+        return "Assessment Notes.pdf"
+    elif file_key == "ICP Description":
+        # For ICP Description, keep the original extension
+        extension = os.path.splitext(file_path)[1]
+        return f"ICP Description{extension}"
+    else:
+        # For any other files, keep original name
+        return os.path.basename(file_path)
+
+def _store_redacted(workspace, file_key, dest_path, text, saved):
+    """Points the later stages to the redacted text, or to the redacted copy if there is no text."""
+    if text is not None:
+        workspace.texts[file_key] = text
+    if saved or text is None:
+        workspace.files[file_key] = dest_path
+
+def redact_folder(GUI_data, workspace):
+    """
+    Redacts specified names in the specific PDF files provided via GUI_data.
+
+    Each PDF is opened once, redacted in memory and its redacted text is
+    stored in workspace.texts for the prompting stage. The redacted PDF is
+    only written to the workspace if saving is enabled (save_redacted_pdfs or
+    GUI_data["Save Redacted PDFs"]) or if its text has to be extracted from
+    the redacted copy (GUI_data["PDF Backend"] is not PyMuPDF, or the PDF is
+    long enough for parallel extraction); workspace.files then points to it.
+    Other files are copied into the workspace. GUI_data itself is not modified.
+
+    Returns:
+        workspace.files (file key -> path for the later stages)
+    """
+
+    # Until a file has been copied, later stages read the original
+    workspace.files = dict(GUI_data.get("Files", {}))
+    workspace.texts = {}
 
     # Extract names needed for redaction from GUI_data
     applicant_name = GUI_data.get("Applicant Name", "").strip()
@@ -104,13 +300,13 @@ def redact_folder(GUI_data):
     # Instantiate Redactor ONCE with the names
     if not target_names_list:
         print("Warning: No Applicant or Assessor names provided for redaction. Skipping redaction.")
-        return # No names to redact
+        return workspace.files # No names to redact
 
     try:
         redactor = Redactor(target_names=target_names_list)
     except Exception as e:
         print(f"Error initializing Redactor: {e}")
-        return
+        return workspace.files
 
     print("Starting redaction process on provided files...")
 
@@ -118,55 +314,80 @@ def redact_folder(GUI_data):
     files_to_process = GUI_data.get("Files", {})
     if not files_to_process:
         print("Warning: No files found in GUI_data['Files'] to process.")
-        return
+        return workspace.files
+
+    save_pdfs = GUI_data.get("Save Redacted PDFs", save_redacted_pdfs)
+    # Resolved here, so the pool processes use the backend of this run
+    pdf_backend = GUI_data.get("PDF Backend") or pdf_text.default_backend
+    workspace.redaction_timings = {}
 
-    # --- First, copy all files to the temp directory ---
+    # --- PDFs: redact in memory in the process pool, one document per worker ---
+    pending = {}  # file key -> (future, original path, workspace path)
+    to_copy = []  # (file key, original path, workspace path)
     for file_key, file_path in files_to_process.items():
         if not file_path or not os.path.isfile(file_path):
-            print(f"Skipping copy for '{file_key}': File path missing or invalid ('{file_path}')")
+            print(f"Skipping '{file_key}': File path missing or invalid ('{file_path}')")
             continue
 
-        # Determine destination name in temp directory
-        # Use standard names expected by send_prompts
-        if file_key == "PAPI Gebruikersrapport":
-            dest_path = "temp/PAPI Gebruikersrapport.pdf"
-        elif file_key == "Cog. Test":
-            dest_path = "temp/Cog. Test.pdf"
-        elif file_key == "Assessment Notes":
-            dest_path = "temp/Assessment Notes.pdf"
-        elif file_key == "ICP Description":
-            # For ICP Description, keep the original extension
-            extension = os.path.splitext(file_path)[1]
-            dest_path = f"temp/ICP Description{extension}"
-        else:
-            # For any other files, keep original name
-            dest_path = f"temp/{os.path.basename(file_path)}"
-            
+        dest_path = workspace.file_path(_workspace_file_name(file_key, file_path))
+        if file_path.lower().endswith('.pdf'):
+            print(f"Processing PDF file: {file_path}")
+            try:
+                future = _get_pool().submit(_redact_file, redactor.target_names, file_path,
+                                            dest_path, save_pdfs, pdf_backend)
+                pending[file_key] = (future, file_path, dest_path)
+                continue
+            except Exception as e:
+                # E.g. the pool could not be started; redact in this process instead
+                print(f"Warning: Could not start parallel redaction for {file_path}: {e}")
+                _reset_pool()
+                try:
+                    start = time.time()
+                    text = redactor.redact_and_extract(file_path, save_to=dest_path, backend=pdf_backend,
+                                                       save_always=save_pdfs)
+                    workspace.redaction_timings[file_key] = time.time() - start
+                    _store_redacted(workspace, file_key, dest_path, text, save_pdfs)
+                    continue
+                except Exception as e:
+                    # Fall back to redacting a copy on disk
+                    print(f"ERROR redacting {file_path} in memory, redacting a copy instead: {e}")
+        to_copy.append((file_key, file_path, dest_path))
+
+    # --- Collect the results of the workers ---
+    for file_key, (future, file_path, dest_path) in pending.items():
+        try:
+            text, workspace.redaction_timings[file_key] = future.result()
+            print(f"  Redacted {file_key} in {workspace.redaction_timings[file_key]:.2f}s")
+            _store_redacted(workspace, file_key, dest_path, text, save_pdfs)
+        except Exception as e:
+            # Fall back to redacting a copy on disk
+            print(f"ERROR redacting {file_path} in memory, redacting a copy instead: {e}")
+            if isinstance(e, BrokenProcessPool):
+                _reset_pool()
+            to_copy.append((file_key, file_path, dest_path))
+
+    # --- Other files (and failed PDFs): copy to the workspace ---
+    for file_key, file_path, dest_path in to_copy:
         try:
-            # Copy the file to temp directory
+            # Copy the file to the workspace directory
             print(f"Copying {file_path} to {dest_path}")
             shutil.copy2(file_path, dest_path)
-            
-            # Update the file path in GUI_data to point to the new location
-            GUI_data["Files"][file_key] = dest_path
-        except Exception as e:
-            print(f"Error copying file {file_path} to temp directory: {e}")
-            continue
 
-    # --- Now redact the files in the temp directory ---
-    for file_key, file_path in GUI_data["Files"].items():
-        # Skip if file path is invalid after copying
-        if not file_path or not os.path.isfile(file_path):
-            print(f"Skipping redaction for '{file_key}': File path missing or invalid after copy ('{file_path}')")
+            # Point the later stages to the new location
+            workspace.files[file_key] = dest_path
+        except Exception as e:
+            print(f"Error copying file {file_path} to workspace directory: {e}")
             continue
 
-        # --- Only redact PDF files ---
+        # Only the workspace copy is redacted, never the user's original file
         if file_path.lower().endswith('.pdf'):
-            print(f"Processing PDF file: {file_path}")
             try:
-                redactor.redaction(filename=file_path) # Pass the correct filename
+                start = time.time()
+                redactor.redaction(filename=dest_path)
+                workspace.redaction_timings[file_key] = time.time() - start
             except Exception as e:
                 # Log error but continue with other files
-                print(f"ERROR redacting file {file_path}: {e}")
+                print(f"ERROR redacting file {dest_path}: {e}")
 
-    print("Redaction process finished.")
\ No newline at end of file
+    print("Redaction process finished.")
+    return workspace.files
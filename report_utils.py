@@ -10,10 +10,17 @@ import sys
 from datetime import datetime
 import re
 import ast
+import bisect
+import io
 import json
+import threading
+import weakref
 from docx.shared import Pt, Inches, RGBColor
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
+from docx.oxml.shape import CT_Inline
+from template_index import TEMPLATE_PLACEHOLDER_PATTERN, indexed_paragraphs
+from instrumentation import traced
 
 def resource_path(relative_path):
     """
@@ -108,6 +115,62 @@ def _safe_add_paragraph(cell, text):
         rFonts.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}hAnsi', 'Montserrat Light')
         rPr.append(rFonts)
 
+# --- Rating Icons ---
+# Score -> icon file used in the profile review tables
+ICON_FILES = {
+    -1: "resources/improvement.png",
+    0: "resources/average.png",
+    1: "resources/strong.png",
+}
+
+_icon_blobs = {}  # icon file -> PNG bytes, read once per process
+_icon_images = weakref.WeakKeyDictionary()  # document part -> {(icon file, width): (rId, cx, cy)}
+_icon_lock = threading.Lock()
+
+def _icon_blob(icon_file):
+    with _icon_lock:
+        blob = _icon_blobs.get(icon_file)
+        if blob is None:
+            with open(resource_path(icon_file), 'rb') as f:
+                blob = f.read()
+            _icon_blobs[icon_file] = blob
+        return blob
+
+def add_icon_picture(run, score, width=Inches(.3)):
+    """
+    Adds the rating icon for a score to a run.
+
+    Each icon is added to a document once as an image part; every further
+    cell references that part by its relationship id, so the PNG is neither
+    re-read from disk nor re-hashed for each cell.
+
+    Args:
+        run: The run that receives the icon
+        score: -1 (improvement), 0 (average) or 1 (strong)
+        width: Display width of the icon
+
+    Returns:
+        True if an icon was added, False if the score has no icon
+    """
+    icon_file = ICON_FILES.get(score)
+    if icon_file is None:
+        return False
+
+    part = run.part
+    with _icon_lock:
+        images = _icon_images.setdefault(part, {})
+    key = (icon_file, width)
+    if key not in images:
+        rId, image = part.get_or_add_image(io.BytesIO(_icon_blob(icon_file)))
+        cx, cy = image.scaled_dimensions(width, None)
+        images[key] = (rId, cx, cy)
+    rId, cx, cy = images[key]
+
+    # Named after the icon file, as when the picture is added by path
+    inline = CT_Inline.new_pic_inline(part.next_id, rId, os.path.basename(icon_file), cx, cy)
+    run._r.add_drawing(inline)
+    return True
+
 def _safe_literal_eval(s, default=None):
     """
     Safely evaluates a string as a Python literal, removing backslashes.
@@ -179,16 +242,13 @@ def shuttle_text(shuttle):
         t += run.text
     return t
 
-def replace_text_preserving_format(doc, data):
+def _collect_paragraphs(doc):
     """
-    Replaces text in paragraphs and tables, preserving formatting.
-    Handles cases where the text to replace spans multiple runs.
-    Args:
-        doc: The python-docx Document object.
-        data: A dictionary {key_to_replace: replacement_value}.
-              Replacement value may contain '<<BREAK>>' markers.
+    Returns every paragraph of the body, body tables, headers and footers once.
+
+    Merged table cells are returned by python-docx once per grid position, so
+    paragraphs are de-duplicated on their XML element.
     """
-    print("Replacing text while preserving format...")
     paragraphs = list(doc.paragraphs)
     for table in doc.tables:
         for row in table.rows:
@@ -208,84 +268,111 @@ def replace_text_preserving_format(doc, data):
                  for cell in row.cells:
                      paragraphs.extend(cell.paragraphs)
 
+    seen = set()
+    unique = []
+    for p in paragraphs:
+        if p._p not in seen:
+            seen.add(p._p)
+            unique.append(p)
+    return unique
 
-    for key, value in data.items():
-        key_to_find = str(key) # Placeholder like {prompt3_personality}
-        replacement_value = str(value)
-
-        for p in paragraphs:
-            if key_to_find not in p.text:
-                continue
-
-            # This inner logic tries to find the key across runs
-            begin = 0
-            while begin < len(p.runs):
-                end = begin
-                current_text = ""
-                key_found_in_shuttle = False
-
-                # Expand the shuttle until the key is potentially found
-                while end < len(p.runs):
-                    shuttle = p.runs[begin:end+1]
-                    current_text = shuttle_text(shuttle)
-                    if key_to_find in current_text:
-                        key_found_in_shuttle = True
-                        break
-                    # If key starts within this shuttle but isn't complete, keep expanding
-                    partial_match = False
-                    for i in range(len(key_to_find), 0, -1):
-                         if current_text.endswith(key_to_find[:i]):
-                              partial_match = True
-                              break
-                    if not partial_match and not key_to_find.startswith(current_text):
-                         # Optimization: if key cannot start with current text, advance 'begin' faster
-                          break
-                    end += 1
-
-                if key_found_in_shuttle:
-                    # Key found spanning runs from 'begin' to 'end'
-                    shuttle = p.runs[begin:end+1]
-                    full_shuttle_text = shuttle_text(shuttle)
-                    # print(f"Found '{key_to_find}' in runs {begin}-{end}: {[r.text for r in shuttle]}")
-
-                    # Perform the replacement
-                    start_index_in_full = full_shuttle_text.find(key_to_find)
-                    end_index_in_full = start_index_in_full + len(key_to_find)
-
-                    # Calculate which part belongs to which run and replace/clear
-                    processed_len = 0
-                    first_run_processed = False
-                    for i, run in enumerate(shuttle):
-                        run_len = len(run.text)
-                        run_start = processed_len
-                        run_end = processed_len + run_len
-
-                        # Determine intersection of run with the key's location
-                        replace_start_in_run = max(0, start_index_in_full - run_start)
-                        replace_end_in_run = min(run_len, end_index_in_full - run_start)
-
-                        if replace_start_in_run < replace_end_in_run: # This run overlaps with the key
-                            original_text = run.text
-                            if not first_run_processed:
-                                # First run gets the replacement value + surrounding text
-                                run.text = original_text[:replace_start_in_run] + replacement_value + original_text[replace_end_in_run:]
-                                first_run_processed = True
-                            else:
-                                # Subsequent runs overlapping the key get cleared in that section
-                                run.text = original_text[:replace_start_in_run] + original_text[replace_end_in_run:]
-                        processed_len += run_len
-
-                    # After replacement, restart search from the run *after* the replaced section
-                    # This is tricky; a simpler approach might be to just advance 'begin' past 'end'
-                    # or simply break and rely on multiple passes if needed.
-                    # For simplicity, let's just advance begin past the affected runs.
-                    begin = end + 1 # Move past the runs we just processed
-                    continue # Continue the outer while loop
+def compile_placeholder_pattern(keys):
+    """
+    Compiles one regex that matches any of the given placeholders.
 
-                else:
-                     # Key not found starting at 'begin', advance 'begin'
-                    begin += 1
-    print("Text replacement finished.")
+    Longer keys are tried first, so a placeholder that contains another one
+    (e.g. '{prompt5_language_dutch}' and '{prompt5_language}') wins.
+    """
+    keys = sorted((str(k) for k in keys if str(k)), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(k) for k in keys)) if keys else None
+
+def replace_in_paragraph(paragraph, pattern, replacements):
+    """
+    Replaces every placeholder match in one paragraph, preserving run formatting.
+
+    The run texts are concatenated once and matched with the compiled pattern.
+    Each match is mapped back to the runs it spans: the first run receives the
+    replacement value, the overlapping part of the following runs is removed.
+
+    Args:
+        paragraph: The python-docx Paragraph
+        pattern: Compiled pattern (see compile_placeholder_pattern)
+        replacements: Dictionary {placeholder: replacement string}
+
+    Returns:
+        Number of placeholders replaced
+    """
+    runs = paragraph.runs
+    if not runs:
+        return 0
+    texts = [run.text for run in runs]
+    matches = list(pattern.finditer(''.join(texts)))
+    if not matches:
+        return 0
+
+    # Start offset of each run in the concatenated text
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+
+    new_texts = list(texts)
+    # Work from the last match backwards so the offsets of earlier matches stay valid
+    for match in reversed(matches):
+        match_start, match_end = match.span()
+        first = bisect.bisect_right(starts, match_start) - 1  # Run where the match begins
+        i = first
+        while i < len(runs) and starts[i] < match_end:
+            start_in_run = max(0, match_start - starts[i])
+            end_in_run = min(len(texts[i]), match_end - starts[i])
+            if i == first:
+                # First run gets the replacement value + surrounding text
+                new_texts[i] = new_texts[i][:start_in_run] + replacements[match.group(0)] + new_texts[i][end_in_run:]
+            else:
+                # Subsequent runs overlapping the key get cleared in that section
+                new_texts[i] = new_texts[i][:start_in_run] + new_texts[i][end_in_run:]
+            i += 1
+
+    for run, old_text, new_text in zip(runs, texts, new_texts):
+        if new_text != old_text:
+            run.text = new_text
+    return len(matches)
+
+@traced("replace_text_preserving_format")
+def replace_text_preserving_format(doc, data, index=None):
+    """
+    Replaces text in paragraphs and tables, preserving formatting.
+    Handles cases where the text to replace spans multiple runs.
+
+    All placeholders are matched in a single pass over the document with one
+    compiled pattern, so the cost grows linearly with the document size.
+    Replacement values are inserted as-is and are not scanned for placeholders again.
+
+    Args:
+        doc: The python-docx Document object.
+        data: A dictionary {key_to_replace: replacement_value}.
+              Replacement value may contain '<<BREAK>>' markers.
+        index: Optional template index (see template_index.py). Only the
+               paragraphs it lists are visited, instead of the whole document.
+    """
+    print("Replacing text while preserving format...")
+    replacements = {str(key): str(value) for key, value in data.items() if str(key)}
+    pattern = compile_placeholder_pattern(replacements)
+    if pattern is None:
+        print("Text replacement finished.")
+        return
+
+    # The index only knows the standard placeholders; anything else needs a full scan
+    if index is not None and all(TEMPLATE_PLACEHOLDER_PATTERN.fullmatch(key) for key in replacements):
+        paragraphs = indexed_paragraphs(doc, index)
+    else:
+        paragraphs = _collect_paragraphs(doc)
+
+    count = 0
+    for p in paragraphs:
+        count += replace_in_paragraph(p, pattern, replacements)
+    print(f"Text replacement finished ({count} placeholders replaced).")
 
 # Remove or comment out the old add_bulleted_content function
 # def add_bulleted_content(doc, content, target_paragraph=None): ...
@@ -545,18 +632,27 @@ def open_file(file_path):
     elif os.name == 'posix':  # macOS, Linux
         os.system(f'open "{file_path}"') 
 
-def split_paragraphs_at_marker_and_style(doc):
+@traced("split_paragraphs_at_marker_and_style")
+def split_paragraphs_at_marker_and_style(doc, paragraphs=None):
     """
     Iterates through the document, splits paragraphs containing '<<BREAK>>',
     creates new paragraphs, and applies 'List Bullet' style to lines starting with '•'.
     Must be called *after* all placeholders have been replaced.
+
+    Args:
+        doc: The python-docx Document object.
+        paragraphs: Optional list of the body paragraphs that can contain markers
+                    (e.g. from the template index). Defaults to all body paragraphs.
     """
     print("Applying final paragraph splitting and styling for <<BREAK>> markers...")
-    # Iterate backwards through paragraphs to safely insert new ones
-    # Using indices is safer when modifying the list of paragraphs
-    i = len(doc.paragraphs) - 1
+    # Iterate backwards through a snapshot of the paragraphs; new paragraphs are
+    # only inserted before the current one, so the earlier entries stay valid
+    if paragraphs is None:
+        paragraphs = doc.paragraphs
+    paragraphs = list(paragraphs)
+    i = len(paragraphs) - 1
     while i >= 0:
-        para = doc.paragraphs[i]
+        para = paragraphs[i]
         if '<<BREAK>>' in para.text:
             parts = para.text.split('<<BREAK>>')
             # The last part stays in the current paragraph (or is the only part if <<BREAK>> is at end)
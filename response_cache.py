@@ -0,0 +1,120 @@
+"""
+Response Cache Module
+
+Opt-in SQLite cache of Gemini responses. An entry is keyed by the model, the
+prompt instructions, the temperature, the thinking config and the hash of the
+document context, so rerunning a report after a template or writer fix
+returns the earlier responses without calling the API, while any change to
+the inputs or settings is a cache miss. Entries older than max_age_days are
+dropped, and the least recently used entries are evicted when the cache
+grows beyond max_cache_bytes.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Location of the cache database (per user, next to the extraction cache)
+cache_path = os.path.expanduser("~/.ormit_art_cache/responses.sqlite3")
+
+# Maximum total size of the cached responses
+max_cache_bytes = 20 * 1024 * 1024
+
+# Entries older than this are never returned and are removed on eviction
+max_age_days = 30
+
+_lock = threading.Lock()
+
+def context_hash(context_text):
+    """Returns the SHA-256 hex digest of the document context."""
+    return hashlib.sha256(context_text.encode('utf-8')).hexdigest()
+
+def make_key(model, prompt_text, temperature, thinking_config, context_digest):
+    """
+    Returns the cache key of one request.
+
+    Args:
+        model: Gemini model name
+        prompt_text: The prompt instructions (without the document context)
+        temperature: Sampling temperature
+        thinking_config: Thinking config dictionary, or None
+        context_digest: context_hash() of the document context
+
+    Returns:
+        Hex digest string
+    """
+    payload = json.dumps([model, prompt_text, temperature, thinking_config, context_digest], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _connect():
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    connection = sqlite3.connect(cache_path, timeout=30)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+        "created REAL NOT NULL, last_used REAL NOT NULL)"
+    )
+    return connection
+
+def get(key):
+    """
+    Returns the cached response for a key, or None on a miss (or any cache error).
+    """
+    try:
+        with _lock:
+            connection = _connect()
+            try:
+                with connection:
+                    row = connection.execute(
+                        "SELECT response FROM responses WHERE key = ? AND created >= ?",
+                        (key, time.time() - max_age_days * 86400)
+                    ).fetchone()
+                    if row is not None:
+                        connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            finally:
+                connection.close()
+        return row[0] if row is not None else None
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read response cache: {e}")
+        return None
+
+def put(key, response):
+    """Stores a response and evicts old and least recently used entries."""
+    try:
+        now = time.time()
+        with _lock:
+            connection = _connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                        (key, response, len(response.encode('utf-8')), now, now)
+                    )
+                    _evict(connection, now)
+            finally:
+                connection.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not write response cache: {e}")
+
+def _evict(connection, now):
+    connection.execute("DELETE FROM responses WHERE created < ?", (now - max_age_days * 86400,))
+    total = 0
+    for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used DESC").fetchall():
+        total += size
+        if total > max_cache_bytes:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+def clear():
+    """Removes all cached responses."""
+    try:
+        with _lock:
+            connection = _connect()
+            try:
+                with connection:
+                    connection.execute("DELETE FROM responses")
+            finally:
+                connection.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not clear response cache: {e}")
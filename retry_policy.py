@@ -0,0 +1,150 @@
+"""
+Retry Policy Module
+
+Decides how Gemini requests are retried: exponential backoff with jitter,
+honouring the delay the API asks for on rate limiting (429 / Retry-After),
+and no retries for permanent errors (e.g. an invalid key or request). A token
+bucket shared by all prompts and candidates in the process with the same
+rate keeps the request rate below the account's quota.
+"""
+import random
+import re
+import threading
+import time
+
+# Gemini requests per minute of the account's quota (paid tier 1 for the default model);
+# GUI_data["Requests Per Minute"] overrides, None or 0 disables the limiter
+requests_per_minute = 1000
+
+# Requests that may be sent at once before the limiter starts spacing them (None = a tenth of a minute's requests)
+burst = None
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class RateLimiter:
+    """
+    Token bucket limiter: allows bursts of `capacity` requests and refills at
+    `rate` requests per second. Thread-safe.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """
+        Blocks until a request may be sent.
+
+        Args:
+            deadline: Optional time.time() value after which to stop waiting
+
+        Returns:
+            True when a token was taken, False if the deadline passed first
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+def _status_code(error):
+    """Returns the HTTP status code of an API error, or None."""
+    for attribute in ("code", "status_code"):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+def retry_after(error):
+    """
+    Returns the delay in seconds the API asked for, or None.
+
+    Looks at the Retry-After header and at the RetryInfo 'retryDelay' detail
+    Gemini includes in 429 responses (e.g. '17s').
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except ValueError:
+            pass
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "")) + str(error))
+    return float(match.group(1)) if match else None
+
+def is_transient(error):
+    """
+    Returns True if a failed request may succeed when retried.
+
+    Rate limiting, timeouts, server errors and connection problems are
+    transient; other client errors (bad request, invalid key, permission
+    denied, unknown model) are permanent.
+    """
+    code = _status_code(error)
+    if code is not None:
+        return code in TRANSIENT_STATUS_CODES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    # Network errors of the HTTP client (e.g. httpx.ConnectError, httpx.ReadTimeout)
+    return any(part in name for part in ("Timeout", "Connect", "Network", "Protocol", "Remote"))
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    The n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** (n - 1)) seconds, or at least as long as
+    the API asked for when it returned a Retry-After delay.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry_no, error=None):
+        """Returns the seconds to wait before retry number retry_no (1-based)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry_no - 1)))
+        requested = retry_after(error) if error is not None else None
+        return max(backoff, requested) if requested is not None else backoff
+
+    def should_retry(self, error):
+        """Returns True if the request should be retried after this error (None = empty result)."""
+        return error is None or is_transient(error)
+
+_limiters = {}  # requests per minute -> RateLimiter
+_limiters_lock = threading.Lock()
+
+def get_limiter(rate_per_minute=None):
+    """
+    Returns the rate limiter for a request rate, shared by all prompts and candidates using that rate.
+
+    Args:
+        rate_per_minute: Requests per minute (default: requests_per_minute)
+
+    Returns:
+        The RateLimiter, or None if the rate is None or 0 (no limit)
+    """
+    rate_per_minute = requests_per_minute if rate_per_minute is None else rate_per_minute
+    if not rate_per_minute:
+        return None
+    with _limiters_lock:
+        if rate_per_minute not in _limiters:
+            capacity = burst if burst is not None else max(1, rate_per_minute // 10)
+            _limiters[rate_per_minute] = RateLimiter(rate=rate_per_minute / 60.0, capacity=capacity)
+        return _limiters[rate_per_minute]
@@ -0,0 +1,187 @@
+"""
+Template Index Module
+
+Compiles a report template once into an index of the locations the writers
+fill in: the paragraphs holding placeholders, the "AA" marker cells of the
+profile review tables and the language skill rows. The index is stored in a
+per-user cache directory under the template's hash (the bundled resources
+may be read-only) and reused until the template changes, so rendering can
+jump straight to these locations instead of scanning the whole document for
+every report.
+"""
+import json
+import os
+import re
+import threading
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+from extraction_cache import file_hash
+
+# Location of the stored indexes (per user, like the extracted text cache)
+index_dir = os.path.expanduser("~/.ormit_art_cache/template_index")
+
+# Bump when the index layout changes, so stored indexes are recompiled
+INDEX_VERSION = 2
+
+# Every placeholder the writers replace: '{prompt...}', '***' and 'ASSESSOR'
+TEMPLATE_PLACEHOLDER_PATTERN = re.compile(r'\{prompt\w+\}|\*\*\*|ASSESSOR')
+
+# Text marking a language skill row in the language skills table
+LANGUAGE_ROW_MARKER = "A1/B1/B2"
+
+# Text marking a cell that receives a rating icon
+ICON_CELL_MARKER = "AA"
+
+_memory_index = {}  # template hash -> index
+_lock = threading.Lock()
+
+def _stories(doc):
+    """
+    Yields (story key, parent, root element) for the body and every distinct header/footer.
+
+    The story key is how placeholder locations refer to the part of the
+    document they live in: 'body', 'header:<section>' or 'footer:<section>'.
+    """
+    yield "body", doc._body, doc.element.body
+    seen = set()
+    for section_no, section in enumerate(doc.sections):
+        for kind, story in (("header", section.header), ("footer", section.footer)):
+            element = story._element
+            if element in seen:
+                continue  # Linked to a previous section
+            seen.add(element)
+            yield f"{kind}:{section_no}", story, element
+
+def compile_template_index(doc, template_hash):
+    """
+    Scans a freshly opened template and records the locations the writers fill in.
+
+    Args:
+        doc: The python-docx Document of the unmodified template
+        template_hash: SHA-256 of the template file
+
+    Returns:
+        The index dictionary
+    """
+    placeholders = []
+    for story_key, parent, root in _stories(doc):
+        for paragraph_no, p in enumerate(root.iter(qn('w:p'))):
+            paragraph = Paragraph(p, parent)
+            full_text = ''.join(run.text for run in paragraph.runs)
+            for match in TEMPLATE_PLACEHOLDER_PATTERN.finditer(full_text):
+                placeholders.append({
+                    "story": story_key,
+                    "paragraph": paragraph_no,
+                    "placeholder": match.group(0),
+                })
+
+    icon_cells = {}
+    language_rows = {}
+    for table_no, table in enumerate(doc.tables):
+        for row_no, row in enumerate(table.rows):
+            if len(row.cells) == 0:
+                continue
+            first_cell_text = table.cell(row_no, 0).text.strip()
+            if first_cell_text.startswith(ICON_CELL_MARKER):
+                icon_cells.setdefault(str(table_no), []).append(row_no)
+            if row_no > 0 and LANGUAGE_ROW_MARKER in first_cell_text:
+                language_rows.setdefault(str(table_no), []).append(row_no)
+
+    return {
+        "version": INDEX_VERSION,
+        "template_hash": template_hash,
+        "placeholders": placeholders,
+        "icon_cells": icon_cells,          # table -> rows whose first cell starts with "AA"
+        "language_rows": language_rows,    # table -> rows whose first cell holds "A1/B1/B2"
+    }
+
+def index_path_for(template_hash):
+    """Returns the path the index of a template with this hash is stored at."""
+    return os.path.join(index_dir, f"{template_hash}.json")
+
+def load_template_index(template_path, doc=None, template_hash=None):
+    """
+    Returns the index of a template, compiling and storing it if needed.
+
+    The index is looked up in memory, then in index_dir; it is only used if
+    it was compiled from a template with the same hash.
+
+    Args:
+        template_path: Path to the .docx template
+        doc: Optional unmodified Document of the template (avoids opening it again on compile)
+        template_hash: Optional precomputed SHA-256 of the template file
+
+    Returns:
+        The index dictionary, or None if the template could not be indexed
+    """
+    try:
+        if template_hash is None:
+            template_hash = file_hash(template_path)
+    except OSError as e:
+        print(f"Warning: Could not hash template {template_path}: {e}")
+        return None
+
+    with _lock:
+        index = _memory_index.get(template_hash)
+        if index is not None:
+            return index
+
+        index_path = index_path_for(template_hash)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get("version") == INDEX_VERSION and stored.get("template_hash") == template_hash:
+                _memory_index[template_hash] = stored
+                return stored
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable template index {index_path}: {e}")
+
+        print(f"Compiling template index for {os.path.basename(template_path)}...")
+        try:
+            index = compile_template_index(doc if doc is not None else Document(template_path), template_hash)
+        except Exception as e:
+            print(f"Warning: Could not compile template index for {template_path}: {e}")
+            return None
+        _memory_index[template_hash] = index
+
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            # The in-memory index is still used
+            print(f"Warning: Could not store template index {index_path}: {e}")
+        return index
+
+def indexed_paragraphs(doc, index, body_only=False):
+    """
+    Returns the paragraphs that contain placeholders, straight from the index.
+
+    Args:
+        doc: A Document opened from the indexed template (placeholders not yet replaced)
+        index: The template index
+        body_only: Only return paragraphs that are direct children of the body
+
+    Returns:
+        List of Paragraph objects in document order, without duplicates
+    """
+    wanted = {}
+    for location in index["placeholders"]:
+        wanted.setdefault(location["story"], set()).add(location["paragraph"])
+
+    paragraphs = []
+    for story_key, parent, root in _stories(doc):
+        if story_key not in wanted or (body_only and story_key != "body"):
+            continue
+        ordinals = wanted[story_key]
+        for paragraph_no, p in enumerate(root.iter(qn('w:p'))):
+            if paragraph_no in ordinals and (not body_only or p.getparent() is root):
+                paragraphs.append(Paragraph(p, parent))
+    return paragraphs
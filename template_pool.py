@@ -0,0 +1,73 @@
+"""
+Template Pool Module
+
+Keeps every report template parsed in memory once per process and hands out
+an independent copy for each report, so a batch run does not unzip and parse
+the same .docx for every candidate. Copies are deep copies of the parsed
+document; if a template cannot be deep-copied, it is re-parsed from an
+in-memory byte snapshot instead of from disk.
+"""
+import copy
+import hashlib
+import io
+import os
+import threading
+
+from docx import Document
+
+_pool = {}  # template path -> _PooledTemplate
+_lock = threading.Lock()
+
+class _PooledTemplate:
+    """A parsed template plus the information needed to copy and validate it."""
+
+    def __init__(self, template_path):
+        with open(template_path, 'rb') as f:
+            self.snapshot = f.read()
+        stat = os.stat(template_path)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.template_hash = hashlib.sha256(self.snapshot).hexdigest()
+        self.prototype = Document(io.BytesIO(self.snapshot))
+        self.deepcopy_supported = True
+        self.lock = threading.Lock()
+
+    def copy(self):
+        """Returns an independent Document equal to the unmodified template."""
+        if self.deepcopy_supported:
+            try:
+                # The prototype is never modified, the lock only guards concurrent copies
+                with self.lock:
+                    return copy.deepcopy(self.prototype)
+            except Exception as e:
+                print(f"Warning: Template cannot be deep-copied, using byte snapshot instead: {e}")
+                self.deepcopy_supported = False
+        return Document(io.BytesIO(self.snapshot))
+
+def _pooled(template_path):
+    key = os.path.abspath(template_path)
+    stat = os.stat(key)
+    with _lock:
+        pooled = _pool.get(key)
+        if pooled is None or pooled.signature != (stat.st_mtime_ns, stat.st_size):
+            # First use, or the template was edited on disk
+            pooled = _PooledTemplate(key)
+            _pool[key] = pooled
+        return pooled
+
+def open_template(template_path):
+    """
+    Returns a fresh copy of a template and the template's hash.
+
+    Args:
+        template_path: Path to the .docx template
+
+    Returns:
+        Tuple (Document, SHA-256 of the template file)
+    """
+    pooled = _pooled(template_path)
+    return pooled.copy(), pooled.template_hash
+
+def clear():
+    """Drops all pooled templates (they are parsed again on next use)."""
+    with _lock:
+        _pool.clear()
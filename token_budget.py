@@ -0,0 +1,265 @@
+"""
+Token Budget Module
+
+Pre-flight token accounting for the prompt context. Every document is
+counted before the prompts are sent, with Gemini's count_tokens endpoint or,
+when that is unavailable (no network, fake backend), an offline estimate.
+Documents over their budget are trimmed, low-value content first: lines
+repeated across pages (headers and footers of the PAPI report) are dropped,
+then the middle of the document is cut, so its introduction and conclusion
+are kept. If the whole context is still over its budget (by default the
+model's input token limit), the documents in trim_order are trimmed further.
+The candidate's own source documents (the assessment notes and the cognitive
+test) are never trimmed: the ratings and scores the prompts extract live
+there, so a context that does not fit without trimming them is sent anyway,
+with a warning.
+"""
+import hashlib
+import re
+import threading
+import time
+
+from retry_policy import RetryPolicy, is_transient
+
+# Count with the API's count_tokens; False always uses the offline estimate
+use_count_tokens_api = True
+
+# Characters per token for the offline estimate
+chars_per_token = 4
+
+# Attempts per count_tokens call on transient errors (rate limiting, server errors)
+count_tokens_attempts = 3
+
+# Maximum tokens per document (documents not listed are never trimmed)
+document_token_budgets = {
+    "PAPI Gebruikersrapport.pdf": 8000,
+    "Context and Task Description.docx": 10000,
+    "Examples Personality Section.docx": 4000,
+    "The MCP Profile.docx": 6000,
+    "The Data Chiefs profile.docx": 6000,
+    "ICP Traineeship Description.docx": 6000,
+}
+
+# Maximum tokens of all documents together; None uses the model's input token limit minus
+# context_token_reserve (GUI_data["Context Token Budget"] overrides)
+context_token_budget = None
+
+# Input token limit used when the model's own limit cannot be looked up (Gemini 2.x models)
+default_input_token_limit = 1048576
+
+# Tokens of the input limit left for the prompt instructions and per-prompt text
+context_token_reserve = 32000
+
+# Documents that may be trimmed when the whole context is over budget (least valuable first)
+trim_order = [
+    "Examples Personality Section.docx",
+    "PAPI Gebruikersrapport.pdf",
+    "The MCP Profile.docx",
+    "The Data Chiefs profile.docx",
+    "ICP Traineeship Description.docx",
+    "Context and Task Description.docx",
+]
+
+# A line occurring at least this often in a document is treated as boilerplate
+boilerplate_min_repeats = 3
+
+# Lines shorter than this are never boilerplate (e.g. repeated "Yes" ratings)
+boilerplate_min_length = 20
+
+# Documents whose repeated lines may be removed (never the notes: ratings repeat there)
+boilerplate_documents = [
+    "PAPI Gebruikersrapport.pdf",
+    "Examples Personality Section.docx",
+    "Context and Task Description.docx",
+    "The MCP Profile.docx",
+    "The Data Chiefs profile.docx",
+    "ICP Traineeship Description.docx",
+]
+
+# Smallest share of a document kept when the whole context is trimmed
+min_keep_share = 0.25
+
+TRIM_MARKER = "\n\n[... {tokens} tokens trimmed ...]\n\n"
+
+def estimate_tokens(text):
+    """Returns the offline token estimate for a text."""
+    return (len(text) + chars_per_token - 1) // chars_per_token
+
+class TokenCounter:
+    """
+    Counts tokens with the client's count_tokens, falling back to estimate_tokens.
+
+    Counts are memoized per text. Transient errors are retried with backoff;
+    when a call still fails (e.g. no network) or fails permanently, the
+    counter stays offline for the rest of the run. Thread-safe.
+    """
+
+    def __init__(self, client, model, use_api=None):
+        self.client = client
+        self.model = model
+        self.use_api = use_count_tokens_api if use_api is None else use_api
+        self._counts = {}
+        self._input_token_limit = None
+        self._lock = threading.Lock()
+
+    @property
+    def offline(self):
+        """True if counts come from the offline estimate."""
+        return not self.use_api
+
+    def count(self, text):
+        """Returns the number of tokens in text."""
+        if not text:
+            return 0
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            if key in self._counts:
+                return self._counts[key]
+        tokens = self._count_with_api(text) if self.use_api else None
+        if not isinstance(tokens, int):
+            tokens = estimate_tokens(text)
+        with self._lock:
+            self._counts[key] = tokens
+        return tokens
+
+    def input_token_limit(self):
+        """Returns the model's input token limit, or default_input_token_limit if it cannot be looked up."""
+        if self._input_token_limit is None:
+            limit = None
+            if self.use_api:
+                try:
+                    limit = self.client.models.get(model=self.model).input_token_limit
+                except Exception as e:
+                    print(f"Warning: Could not look up the input token limit of {self.model}: {e}")
+            self._input_token_limit = limit if isinstance(limit, int) and limit > 0 else default_input_token_limit
+        return self._input_token_limit
+
+    def context_budget(self):
+        """Returns the default context budget: the input token limit minus context_token_reserve."""
+        return max(0, self.input_token_limit() - context_token_reserve)
+
+    def _count_with_api(self, text):
+        """Returns the API's token count, or None after switching to the offline estimate."""
+        policy = RetryPolicy(max_attempts=count_tokens_attempts)
+        for attempt in range(1, policy.max_attempts + 1):
+            try:
+                return self.client.models.count_tokens(model=self.model, contents=text).total_tokens
+            except Exception as e:
+                if attempt < policy.max_attempts and is_transient(e):
+                    time.sleep(policy.delay(attempt, e))
+                    continue
+                print(f"Warning: count_tokens unavailable, estimating token counts offline: {e}")
+                self.use_api = False
+                return None
+
+def remove_boilerplate(text):
+    """
+    Drops repeated occurrences of lines that occur at least boilerplate_min_repeats
+    times and are at least boilerplate_min_length characters long.
+
+    The first occurrence is kept, so a heading repeated on every page appears once.
+    """
+    lines = text.split('\n')
+    occurrences = {}
+    for line in lines:
+        stripped = line.strip()
+        if len(stripped) >= boilerplate_min_length:
+            occurrences[stripped] = occurrences.get(stripped, 0) + 1
+    seen = set()
+    kept = []
+    for line in lines:
+        stripped = line.strip()
+        if occurrences.get(stripped, 0) >= boilerplate_min_repeats:
+            if stripped in seen:
+                continue
+            seen.add(stripped)
+        kept.append(line)
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(kept))
+
+def truncate_middle(text, tokens, max_tokens):
+    """
+    Cuts the middle of a text so it fits in max_tokens.
+
+    Args:
+        text: The text
+        tokens: Its token count
+        max_tokens: Tokens to keep
+
+    Returns:
+        The text with its beginning and end kept around a trim marker
+    """
+    if tokens <= max_tokens:
+        return text
+    keep_chars = int(len(text) * max_tokens / tokens)
+    head = text[:keep_chars // 2]
+    tail = text[len(text) - (keep_chars - len(head)):] if keep_chars > len(head) else ""
+    # Cut at line boundaries, so no sentence starts or ends halfway
+    if '\n' in head:
+        head = head[:head.rindex('\n')]
+    if '\n' in tail:
+        tail = tail[tail.index('\n') + 1:]
+    return head + TRIM_MARKER.format(tokens=tokens - max_tokens) + tail
+
+def _trim(name, text, tokens, max_tokens, counter):
+    """Trims a document to max_tokens and returns (text, tokens)."""
+    if tokens <= max_tokens:
+        return text, tokens
+    if name in boilerplate_documents:
+        text = remove_boilerplate(text)
+        tokens = counter.count(text)
+    if tokens > max_tokens:
+        text = truncate_middle(text, tokens, max_tokens)
+        tokens = counter.count(text)
+    return text, tokens
+
+def apply_budgets(file_contents, counter, budgets=None, total_budget=None):
+    """
+    Counts the tokens of every document and trims documents over budget.
+
+    Args:
+        file_contents: Dictionary of document name -> text
+        counter: TokenCounter
+        budgets: Maximum tokens per document name (default: document_token_budgets)
+        total_budget: Maximum tokens of all documents (default: context_token_budget, or
+                      counter.context_budget() if that is None; 0 disables the check)
+
+    Returns:
+        Tuple (trimmed file_contents, dictionary of document name -> token count). If the
+        documents not in trim_order alone are over total_budget, they are returned over budget.
+    """
+    budgets = document_token_budgets if budgets is None else budgets
+    total_budget = context_token_budget if total_budget is None else total_budget
+    if total_budget is None:
+        total_budget = counter.context_budget()
+
+    contents = {}
+    counts = {}
+    original = {}
+    for name, text in file_contents.items():
+        tokens = counter.count(text)
+        original[name] = tokens
+        budget = budgets.get(name)
+        contents[name], counts[name] = _trim(name, text, tokens, budget, counter) if budget else (text, tokens)
+
+    excess = sum(counts.values()) - total_budget if total_budget else 0
+    trimmable = [name for name in trim_order if name in contents]
+    for name in trimmable:
+        if excess <= 0:
+            break
+        floor = int(original[name] * min_keep_share)
+        target = max(floor, counts[name] - excess)
+        if target < counts[name]:
+            before = counts[name]
+            contents[name], counts[name] = _trim(name, contents[name], counts[name], target, counter)
+            excess -= before - counts[name]
+
+    source = "estimated" if counter.offline else "counted"
+    for name, tokens in counts.items():
+        trimmed = f" (trimmed from {original[name]})" if tokens < original[name] else ""
+        print(f"Context document '{name}': {tokens} tokens{trimmed}")
+    print(f"Context total: {sum(counts.values())} tokens ({source})")
+    if excess > 0:
+        print(f"Warning: The documents are about {excess} tokens over the context budget of {total_budget} "
+              f"tokens, even after trimming {', '.join(trimmable) or 'nothing'}. The assessment notes and "
+              f"cognitive test are not trimmed, so the context is sent over budget.")
+    return contents, counts
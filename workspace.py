@@ -0,0 +1,88 @@
+"""
+Workspace Module
+
+A workspace is the private working directory of one report run. Input files
+are copied and redacted inside it, the prompting stage reads them from it and
+output files get unique names, so several runs (in one process or on one
+machine) never overwrite each other's files.
+"""
+import os
+import shutil
+import tempfile
+
+class Workspace:
+    """
+    Per-run working directory.
+
+    Attributes:
+        path: The run's private directory (created on construction)
+        output_dir: Directory where the run's results and report are saved
+        files: Mapping of file key (e.g. "Assessment Notes") to the path the
+               later stages should read (the redacted copy once redaction ran)
+        texts: Mapping of file key to the redacted text extracted during
+               redaction, so the prompting stage does not re-read those files
+        redaction_timings: Mapping of file key to the seconds its redaction took
+    """
+
+    def __init__(self, base_dir='temp', output_dir='output_reports', prefix='run_'):
+        os.makedirs(base_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=base_dir)
+        self.output_dir = output_dir
+        self.files = {}
+        self.texts = {}
+        self.redaction_timings = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+    @property
+    def run_id(self):
+        """Unique name of this run (the directory name)."""
+        return os.path.basename(self.path)
+
+    def file_path(self, filename):
+        """Returns the path of a file inside the workspace directory."""
+        return os.path.join(self.path, filename)
+
+    def reserve_output_path(self, filename):
+        """
+        Returns a path in the output directory that no other run will use.
+
+        The file is created empty to reserve the name, so reserve it right
+        before writing and call release_output_path if the write fails. If
+        the name is already taken a counter is appended, e.g. 'Report (2).docx'.
+
+        Args:
+            filename: Desired file name
+
+        Returns:
+            Path of the reserved (empty) output file
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem, extension = os.path.splitext(filename)
+        counter = 1
+        while True:
+            candidate = filename if counter == 1 else f"{stem} ({counter}){extension}"
+            path = os.path.join(self.output_dir, candidate)
+            try:
+                # O_EXCL makes the check-and-create atomic across threads and processes
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return path
+            except FileExistsError:
+                counter += 1
+
+    def release_output_path(self, path):
+        """Removes a reserved output file after its write failed, so no empty file is left behind."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """Removes the workspace directory and everything in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
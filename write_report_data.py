@@ -1,7 +1,6 @@
 import os
 import sys
 from datetime import datetime
-from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
@@ -15,8 +14,12 @@ from report_utils import (
     _safe_add_paragraph, _safe_literal_eval,
     clean, strip_extra_quotes, clean_up, replacePiet, replace_piet_in_list,
     restructure_date, replace_and_format_header_text, open_file,
-    replace_text_preserving_format, split_paragraphs_at_marker_and_style
+    replace_text_preserving_format, split_paragraphs_at_marker_and_style,
+    add_icon_picture
 )
+from template_index import load_template_index, indexed_paragraphs
+from template_pool import open_template
+from instrumentation import span
 
 # --- Constants ---
 DETAILS_TABLE_INDEX = 0
@@ -42,14 +45,24 @@ def replace_placeholder_in_docx(doc, placeholder, replacement, font_name='Montse
                     inline[i].font.name = font_name
                     inline[i].font.size = Pt(font_size)
 
-def update_document(output_dic, name, assessor, gender, program):
-    """Updates the Word document."""
+def update_document(output_dic, name, assessor, gender, program, workspace=None):
+    """
+    Updates the Word document.
+
+    If a workspace is given, the report gets a unique name in its output directory.
+    """
+    template_path = resource_path('resources/Assessment_report_Data_chiefs.docx')
     try:
-        doc = Document(resource_path('resources/Assessment_report_Data_chiefs.docx'))
+        doc, template_hash = open_template(template_path)
     except Exception as e:
         print(f"Error: Failed to open template: {e}")
         return None
 
+    # Locations of placeholders, icon cells and language rows, compiled once per template version
+    index = load_template_index(template_path, doc, template_hash)
+    # Body paragraphs that can receive <<BREAK>> markers (look up before tables are modified)
+    marker_paragraphs = indexed_paragraphs(doc, index, body_only=True) if index else None
+
     # --- Prepare Replacement Dictionary ---
     replacements = {}
 
@@ -74,9 +87,9 @@ def update_document(output_dic, name, assessor, gender, program):
     language_levels = _safe_literal_eval(language_replacements_str, [])
     if isinstance(language_levels, list):
         language_names = ["Dutch", "French", "English"]
-        for index, language_name in enumerate(language_names):
-            if index < len(language_levels):
-                proficiency_level = language_levels[index]
+        for lang_no, language_name in enumerate(language_names):
+            if lang_no < len(language_levels):
+                proficiency_level = language_levels[lang_no]
                 placeholder = f"{{prompt5_language_{language_name.lower()}}}"
                 replacements[placeholder] = proficiency_level
             else:
@@ -85,7 +98,7 @@ def update_document(output_dic, name, assessor, gender, program):
                 replacements[placeholder] = "N/A"
 
     # --- Perform ALL Text Replacements ---
-    replace_text_preserving_format(doc, replacements)
+    replace_text_preserving_format(doc, replacements, index=index)
 
     # --- Handle list prompts that may contain "Piet" ---
     # Operate on the _original JSON data for these prompts
@@ -118,7 +131,7 @@ def update_document(output_dic, name, assessor, gender, program):
     if isinstance(language_replacements_str, str):
         language_replacements_str = language_replacements_str.replace("\\", "")
     language_levels = _safe_literal_eval(language_replacements_str, [])
-    update_language_skills_table(doc, language_levels)
+    update_language_skills_table(doc, language_levels, index=index)
 
     # --- Conclusion Table ---
     # Pass the processed list from the _original key
@@ -133,8 +146,8 @@ def update_document(output_dic, name, assessor, gender, program):
     qual_scores_str = output_dic.get('prompt7_qualscore_data', "[]")
     qual_scores = _safe_literal_eval(qual_scores_str, [])
     if isinstance(qual_scores, list) and len(qual_scores) >= 23:
-        add_icons_data_chief(doc, qual_scores[:18])
-        add_icons_data_chief_2(doc, qual_scores[18:23])
+        add_icons_data_chief(doc, qual_scores[:18], index=index)
+        add_icons_data_chief_2(doc, qual_scores[18:23], index=index)
     else:
         print(f"Warning: Invalid qual_scores data.")
 
@@ -150,20 +163,29 @@ def update_document(output_dic, name, assessor, gender, program):
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
     
-    # Define output directory and ensure it exists
-    output_dir = "output_reports"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    # Save to the output directory
-    updated_doc_path = os.path.join(output_dir, f"Assessment Report - {name} - {formatted_time}.docx")
+    report_filename = f"Assessment Report - {name} - {formatted_time}.docx"
+    if workspace is not None:
+        # Reserve a unique name so concurrent runs never overwrite each other
+        # (released again below if the report cannot be saved)
+        updated_doc_path = workspace.reserve_output_path(report_filename)
+    else:
+        # Define output directory and ensure it exists
+        output_dir = "output_reports"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Save to the output directory
+        updated_doc_path = os.path.join(output_dir, report_filename)
     try:
         # Apply final paragraph splitting and styling *before* saving
-        split_paragraphs_at_marker_and_style(doc) # This handles the display format
-        doc.save(updated_doc_path)
+        split_paragraphs_at_marker_and_style(doc, marker_paragraphs) # This handles the display format
+        with span("doc.save"):
+            doc.save(updated_doc_path)
         print(f"Document saved: {updated_doc_path}") # Added print statement
         return updated_doc_path
     except Exception as e:
+        if workspace is not None:
+            workspace.release_output_path(updated_doc_path)
         print(f"Error: Failed to save document: {e}")
         return None
 
@@ -293,7 +315,19 @@ def add_content_cogcaptable_remark(doc, cogcap_output):
     _safe_set_text(remark_cell, cogcap_output)
 
 
-def add_icons_data_chief(doc, list_scores):
+def _icon_rows(table, table_no, index=None):
+    """Returns the rows (after the header row) whose first cell holds an "AA" icon marker."""
+    if index is not None:
+        # Marker cells were located once when the template was indexed
+        return [row_no for row_no in index["icon_cells"].get(str(table_no), []) if row_no >= 1]
+    icon_rows = []
+    for row_no in range(1, len(table.rows)):
+        cell = _safe_get_cell(table, row_no, 0)
+        if cell and cell.text.strip().startswith("AA"):
+            icon_rows.append(row_no)
+    return icon_rows
+
+def add_icons_data_chief(doc, list_scores, index=None):
     """Adds icons to Human Skills tables."""
     if not isinstance(list_scores, list):
         print(f"Warning: list_scores is not a list.")
@@ -306,21 +340,20 @@ def add_icons_data_chief(doc, list_scores):
         if not table:
             continue
 
-        for row_no in range(1, len(table.rows)):
+        for row_no in _icon_rows(table, table_no, index):
+            cell = _safe_get_cell(table, row_no, 0)
+            if not cell:
+                continue
             if score_index < len(list_scores):
-                cell = _safe_get_cell(table, row_no, 0)
-                if cell and cell.text.strip().startswith("AA"):
-                    add_icon_to_cell(cell, list_scores[score_index])
-                    score_index += 1
+                add_icon_to_cell(cell, list_scores[score_index])
+                score_index += 1
             else:
                 # If we run out of scores, add N/A for remaining cells
-                cell = _safe_get_cell(table, row_no, 0)
-                if cell and cell.text.strip().startswith("AA"):
-                    run = cell.paragraphs[0].add_run("N/A")
-                    run.font.name = 'Montserrat'
-                    run.font.size = Pt(9)
+                run = cell.paragraphs[0].add_run("N/A")
+                run.font.name = 'Montserrat'
+                run.font.size = Pt(9)
 
-def add_icons_data_chief_2(doc, list_scores):
+def add_icons_data_chief_2(doc, list_scores, index=None):
     """Adds icons to Technical Skills tables."""
     if not isinstance(list_scores, list):
         print(f"Warning: list_scores is not a list.")
@@ -333,19 +366,18 @@ def add_icons_data_chief_2(doc, list_scores):
         if not table:
             continue
 
-        for row_no in range(1, len(table.rows)):
+        for row_no in _icon_rows(table, table_no, index):
+            cell = _safe_get_cell(table, row_no, 0)
+            if not cell:
+                continue
             if score_index < len(list_scores):
-                cell = _safe_get_cell(table, row_no, 0)
-                if cell and cell.text.strip().startswith("AA"):
-                    add_icon_to_cell(cell, list_scores[score_index])
-                    score_index += 1
+                add_icon_to_cell(cell, list_scores[score_index])
+                score_index += 1
             else:
                 # If we run out of scores, add N/A for remaining cells
-                cell = _safe_get_cell(table, row_no, 0)
-                if cell and cell.text.strip().startswith("AA"):
-                    run = cell.paragraphs[0].add_run("N/A")
-                    run.font.name = 'Montserrat'
-                    run.font.size = Pt(9)
+                run = cell.paragraphs[0].add_run("N/A")
+                run.font.name = 'Montserrat'
+                run.font.size = Pt(9)
 
 def add_icons_data_tools(doc, list_scores):
     """Adds icons to Data Tools tables."""
@@ -407,13 +439,7 @@ def add_icon_to_cell(cell, score):
         return
         
     run = cell.paragraphs[0].add_run()
-    if score == -1:
-        run.add_picture(resource_path("resources/improvement.png"), width=Inches(.3))
-    elif score == 0:
-        run.add_picture(resource_path("resources/average.png"), width=Inches(.3))
-    elif score == 1:
-        run.add_picture(resource_path("resources/strong.png"), width=Inches(.3))
-    else:
+    if not add_icon_picture(run, score, width=Inches(.3)):
         print(f"Warning: Invalid score value: {score}")
 
 def add_interests_table(doc, interests_text):
@@ -511,13 +537,14 @@ def replace_and_format_header_text(doc, new_text):
                     rFonts.set(qn('w:hAnsi'), 'Montserrat SemiBold')
                     run._element.rPr.append(rFonts)
 
-def update_language_skills_table(doc, language_levels):
+def update_language_skills_table(doc, language_levels, index=None):
     """
     Updates the language skills table (14th table) with language proficiency levels.
     
     Args:
         doc: The Word document
         language_levels: List of language levels [Dutch, French, English]
+        index: Optional template index with the language rows already located
     """
     # Get the language skills table (14th table)
     table = _safe_get_table(doc, LANGUAGE_SKILLS_TABLE_INDEX)
@@ -532,19 +559,23 @@ def update_language_skills_table(doc, language_levels):
     valid_levels = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']
     
     # Find all rows that contain "A1/B1/B2.." - these are our language rows
-    language_rows = []
-    for row_index, row in enumerate(table.rows):
-        # Skip header row
-        if row_index == 0:
-            continue
-            
-        # Get the first cell text to identify if it's a language row
-        if len(row.cells) == 0:
-            continue
-            
-        first_cell_text = row.cells[0].text.strip()
-        if "A1/B1/B2" in first_cell_text:
-            language_rows.append(row_index)
+    if index is not None:
+        # Located once when the template was indexed
+        language_rows = list(index["language_rows"].get(str(LANGUAGE_SKILLS_TABLE_INDEX), []))
+    else:
+        language_rows = []
+        for row_index, row in enumerate(table.rows):
+            # Skip header row
+            if row_index == 0:
+                continue
+                
+            # Get the first cell text to identify if it's a language row
+            if len(row.cells) == 0:
+                continue
+                
+            first_cell_text = row.cells[0].text.strip()
+            if "A1/B1/B2" in first_cell_text:
+                language_rows.append(row_index)
     
     # Update each language row with its corresponding level
     for i, row_index in enumerate(language_rows):
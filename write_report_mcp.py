@@ -1,7 +1,6 @@
 import os
 import sys
 from datetime import datetime
-from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
@@ -15,8 +14,12 @@ from report_utils import (
     _safe_add_paragraph, _safe_literal_eval,
     clean, strip_extra_quotes, clean_up, replacePiet, replace_piet_in_list,
     restructure_date, replace_and_format_header_text, open_file,
-    replace_text_preserving_format, split_paragraphs_at_marker_and_style
+    replace_text_preserving_format, split_paragraphs_at_marker_and_style,
+    add_icon_picture
 )
+from template_index import load_template_index, indexed_paragraphs
+from template_pool import open_template
+from instrumentation import span
 
 # --- Constants specific to MCP report template ---
 DETAILS_TABLE_INDEX = 0
@@ -82,14 +85,24 @@ def set_font_properties2(para):
             rFonts.set(qn('w:hAnsi'), 'Montserrat Light')
             rPr.append(rFonts)
 
-def update_document(output_dic, name, assessor, gender, program):
-    """Updates the Word document (MCP version)."""
+def update_document(output_dic, name, assessor, gender, program, workspace=None):
+    """
+    Updates the Word document (MCP version).
+
+    If a workspace is given, the report gets a unique name in its output directory.
+    """
+    template_path = resource_path('resources/template.docx')  # MCP Template
     try:
-        doc = Document(resource_path('resources/template.docx'))  # MCP Template
+        doc, template_hash = open_template(template_path)
     except Exception as e:
         print(f"Error: Failed to open template: {e}") # Example of console error
         return None
 
+    # Locations of placeholders and icon cells, compiled once per template version
+    index = load_template_index(template_path, doc, template_hash)
+    # Body paragraphs that can receive <<BREAK>> markers (look up before tables are modified)
+    marker_paragraphs = indexed_paragraphs(doc, index, body_only=True) if index else None
+
     # --- Prepare Replacement Dictionary ---
     replacements = {}
 
@@ -114,9 +127,9 @@ def update_document(output_dic, name, assessor, gender, program):
     language_levels = _safe_literal_eval(language_replacements_str, [])
     if isinstance(language_levels, list):
         language_names = ["Dutch", "French", "English"]
-        for index, language_name in enumerate(language_names):
-            if index < len(language_levels):
-                proficiency_level = language_levels[index]
+        for lang_no, language_name in enumerate(language_names):
+            if lang_no < len(language_levels):
+                proficiency_level = language_levels[lang_no]
                 placeholder = f"{{prompt5_language_{language_name.lower()}}}" # Placeholder per language
                 replacements[placeholder] = proficiency_level
             else:
@@ -125,7 +138,7 @@ def update_document(output_dic, name, assessor, gender, program):
                 replacements[placeholder] = "N/A" # Or some default
 
     # --- Perform ALL Text Replacements ---
-    replace_text_preserving_format(doc, replacements)
+    replace_text_preserving_format(doc, replacements, index=index)
 
     # --- Handle list prompts that may contain "Piet" ---
     # (This section remains the same, operating on _original keys)
@@ -168,20 +181,29 @@ def update_document(output_dic, name, assessor, gender, program):
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
     
-    # Define output directory and ensure it exists
-    output_dir = "output_reports"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    # Save to the output directory
-    updated_doc_path = os.path.join(output_dir, f"Assessment Report - {name} - {formatted_time}.docx")
+    report_filename = f"Assessment Report - {name} - {formatted_time}.docx"
+    if workspace is not None:
+        # Reserve a unique name so concurrent runs never overwrite each other
+        # (released again below if the report cannot be saved)
+        updated_doc_path = workspace.reserve_output_path(report_filename)
+    else:
+        # Define output directory and ensure it exists
+        output_dir = "output_reports"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Save to the output directory
+        updated_doc_path = os.path.join(output_dir, report_filename)
     try:
         # Apply final paragraph splitting and styling *before* saving
-        split_paragraphs_at_marker_and_style(doc)
-        doc.save(updated_doc_path)
+        split_paragraphs_at_marker_and_style(doc, marker_paragraphs)
+        with span("doc.save"):
+            doc.save(updated_doc_path)
         print(f"Document saved: {updated_doc_path}") # Added print statement
         return updated_doc_path
     except Exception as e:
+        if workspace is not None:
+            workspace.release_output_path(updated_doc_path)
         print(f"Error: Failed to save document: {e}") # Example of console error
         return None
 
@@ -339,13 +361,7 @@ def add_icon_to_cell(cell, score):
         return
         
     run = cell.paragraphs[0].add_run()
-    if score == -1:
-        run.add_picture(resource_path("resources/improvement.png"), width=Inches(.3))
-    elif score == 0:
-        run.add_picture(resource_path("resources/average.png"), width=Inches(.3))
-    elif score == 1:
-        run.add_picture(resource_path("resources/strong.png"), width=Inches(.3))
-    else:
+    if not add_icon_picture(run, score, width=Inches(.3)):
         print(f"Warning: Invalid score value: {score}") # Example of console warning
 
 def conclusion(doc, column, list_items):